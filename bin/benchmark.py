@@ -0,0 +1,458 @@
+"""
+===========================================================
+OSCAR-DREAM Synthetic Benchmark
+===========================================================
+
+Description:
+-------------
+Measures throughput of the report parser (src/oscar_etl.py) and of the
+OMOP loader (bin/parse.py) on synthetic data, so no real reports or
+cohort files are needed:
+
+- reports/sec and variants/sec (variants extracted by parse_variants)
+  for DOCX parsing, on generated V1-V6 layouts (paragraphs, merged
+  tables, headers and footers)
+- rows/sec for the OMOP load, against a local throwaway PostgreSQL
+  database; the tables are created in a temporary schema that is
+  dropped afterwards
+
+Results can be saved as a JSON baseline, together with the workload
+arguments (--reports, --variants, --samples, --seed). Later runs with the
+same arguments are compared against it, failing when a metric drops more
+than the allowed tolerance.
+
+Usage:
+------
+$ python benchmark.py --reports 200 --samples 5000 --dsn "dbname=bench host=localhost" --save-baseline baseline.json
+$ python benchmark.py --reports 200 --samples 5000 --dsn "dbname=bench host=localhost" --baseline baseline.json
+===========================================================
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import random
+import string
+import sys
+import tempfile
+import time
+from datetime import date, timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+
+GENES = ["BRCA1", "BRCA2", "EGFR", "KRAS", "TP53", "PIK3CA", "ALK", "BRAF", "PTEN", "ATM"]
+CLASSIFICATIONS = ["Pathogenic", "Likely pathogenic", "VUS", "Likely benign", "Benign"]
+REPORT_VERSIONS = ["V1", "V2", "V3", "V4", "V5", "V6"]
+
+BENCHMARK_SCHEMA_DDL = """
+CREATE TABLE CARE_SITE (care_site_id bigint, care_site_name text, place_of_service text, location_id bigint);
+CREATE TABLE PERSON (person_id text, gender bigint, birth_year integer, race text, care_site_id bigint);
+CREATE TABLE PROCEDURE_OCCURRENCE (procedure_occurrence_id bigserial PRIMARY KEY, person_id text,
+    procedure_concept_id bigint, procedure_date date, procedure_type_concept_id bigint);
+CREATE TABLE SPECIMEN (specimen_id bigserial PRIMARY KEY, person_id text, procedure_occurrence_id bigint,
+    specimen_concept_id bigint, specimen_date date, anatomic_site bigint, disease_status bigint);
+CREATE TABLE GENOMIC_TEST (genomic_test_id bigint PRIMARY KEY, care_site_id bigint, genomic_test_name text,
+    genomic_test_version text, reference_genome text, sequencing_device text, target_capture text,
+    read_type text, read_length integer, alignment_tools text, variant_calling_tools text,
+    chromosome_coordinate text, annotation_tools text, annotation_databases text);
+"""
+
+
+# ----------------------------
+# Synthetic Data
+# ----------------------------
+
+def generate_sample_names(count, seed=0):
+    """
+    Generates sample names following the cohort file convention
+    `prefix-...-YYMMDD_...`, e.g. "85abcf000001-WGS-DNA-T01-240628_A00123".
+
+    The prefix encodes birth year and gender as read by extract_age_gender,
+    and the fifth dash-separated field carries the date read by
+    get_procedure_date.
+
+    Parameters:
+        count (int): Number of names to generate.
+        seed (int): Random seed, so runs are reproducible.
+
+    Returns:
+        list: Unique sample names.
+    """
+    rng = random.Random(seed)
+    names = []
+    for index in range(count):
+        birth_year = rng.randint(0, 99)
+        initials = "".join(rng.choices(string.ascii_lowercase, k=3))
+        gender = rng.choice("mf")
+        sample_date = date(2020, 1, 1) + timedelta(days=rng.randint(0, 5 * 365))
+        flowcell = f"A{rng.randint(0, 99999):05d}"
+        names.append(f"{birth_year:02d}{initials}{gender}{index:06d}-WGS-DNA-T{rng.randint(1, 9):02d}-{sample_date:%y%m%d}_{flowcell}")
+    return names
+
+
+def generate_variants(rng, count):
+    """Random (gene, HGVS c., HGVS p., classification) rows for a report."""
+    variants = []
+    for _ in range(count):
+        position = rng.randint(10, 9999)
+        variants.append((
+            rng.choice(GENES),
+            f"c.{position}{rng.choice('ACGT')}>{rng.choice('ACGT')}",
+            f"p.Arg{position // 3}Ter",
+            rng.choice(CLASSIFICATIONS),
+        ))
+    return variants
+
+
+def generate_report(file_path, version, sample_name, variants):
+    """
+    Writes a synthetic genomic report mimicking the layout of a report version.
+
+    V1 is paragraphs only, V2 adds a variant table, V3 adds merged header
+    cells, V4 adds headers and footers and V5/V6 add a second section with
+    its own header, vertically merged cells and an extra table.
+
+    Parameters:
+        file_path (str): Output DOCX path.
+        version (str): Layout version, "V1" to "V6".
+        sample_name (str): Sample name printed in the report.
+        variants (list): Rows from generate_variants.
+    """
+    from docx import Document
+    from docx.enum.section import WD_SECTION
+
+    level = int(version[1:])
+    doc = Document()
+
+    doc.add_heading("Genomic Report", level=1)
+    doc.add_paragraph(f"Sample ID: {sample_name}")
+    doc.add_paragraph("Date of Birth: 01/01/1985")
+    doc.add_paragraph("Test: Whole genome sequencing, DGM_WGS")
+
+    if level == 1:
+        for gene, hgvs_c, hgvs_p, classification in variants:
+            doc.add_paragraph(f"{gene} {hgvs_c} {hgvs_p} {classification}")
+    else:
+        table = doc.add_table(rows=len(variants) + 2, cols=4)
+        header = table.cell(0, 0)
+        if level >= 3:
+            header = header.merge(table.cell(0, 3))
+        header.text = "Reported variants"
+        for col, title in enumerate(["Gene", "cDNA", "Protein", "Classification"]):
+            table.cell(1, col).text = title
+        for row, variant in enumerate(variants, start=2):
+            for col, value in enumerate(variant):
+                table.cell(row, col).text = value
+        if level >= 5 and len(variants) > 1:
+            # Same gene reported twice, shown as one vertically merged cell
+            table.cell(2, 0).merge(table.cell(3, 0))
+
+    doc.add_paragraph("Interpretation: " + " ".join(f"{gene} {classification}." for gene, _, _, classification in variants))
+
+    if level >= 4:
+        section = doc.sections[0]
+        section.header.paragraphs[0].text = f"Rigshospitalet - Department of Genomic Medicine - {version}"
+        section.footer.paragraphs[0].text = f"Confidential - {sample_name}"
+
+    if level >= 5:
+        section = doc.add_section(WD_SECTION.NEW_PAGE)
+        section.header.is_linked_to_previous = False
+        section.header.paragraphs[0].text = "Appendix"
+        doc.add_heading("Appendix: Methods", level=2)
+        methods = doc.add_table(rows=3, cols=2)
+        for row, (key, value) in enumerate([("Reference", "GRC38"), ("Aligner", "BWA"), ("Caller", "GATK")]):
+            methods.cell(row, 0).text = key
+            methods.cell(row, 1).text = value
+        if level >= 6:
+            doc.add_paragraph("Annotation databases: Cosmic_92, Clinvar_20210102, gnomAD_r2.1.1")
+
+    doc.save(file_path)
+
+
+def generate_reports(directory, count, variants_per_report, seed=0):
+    """
+    Generates `count` reports cycling through V1-V6.
+
+    Returns:
+        list: (file path, number of variants) per report.
+    """
+    rng = random.Random(seed)
+    reports = []
+    for index, sample_name in enumerate(generate_sample_names(count, seed)):
+        version = REPORT_VERSIONS[index % len(REPORT_VERSIONS)]
+        variants = generate_variants(rng, variants_per_report)
+        file_path = os.path.join(directory, f"{sample_name}_{version}.docx")
+        generate_report(file_path, version, sample_name, variants)
+        reports.append((file_path, len(variants)))
+    return reports
+
+
+def generate_parity_report(file_path):
+    """
+    Writes a report exercising the text-extraction edge cases the synthetic
+    V1-V6 layouts do not: line, page and column breaks, tabs, hyperlinks,
+    horizontally and vertically merged cells, nested tables and a second
+    section with its own header.
+    """
+    from docx import Document
+    from docx.enum.section import WD_SECTION
+    from docx.enum.text import WD_BREAK
+    from docx.oxml import parse_xml
+    from docx.oxml.ns import nsdecls
+
+    doc = Document()
+    doc.sections[0].header.paragraphs[0].text = "Header\twith tab"
+
+    para = doc.add_paragraph("before")
+    run = para.add_run()
+    run.add_break(WD_BREAK.PAGE)
+    run.add_text("after page")
+    run.add_break(WD_BREAK.COLUMN)
+    run.add_text("after column")
+    run.add_break()
+    run.add_text("after line")
+    run.add_tab()
+    run.add_text("after tab")
+
+    para = doc.add_paragraph("see ")
+    para._p.append(parse_xml(f'<w:hyperlink {nsdecls("w")} w:anchor="variants"><w:r><w:t>BRCA1 c.68_69delAG</w:t></w:r></w:hyperlink>'))
+    para.add_run(" for details")
+
+    table = doc.add_table(rows=4, cols=3)
+    table.cell(0, 0).merge(table.cell(0, 2)).text = "Reported variants"
+    table.cell(1, 0).merge(table.cell(3, 0)).text = "TP53"
+    table.cell(1, 1).merge(table.cell(2, 2)).text = "block"
+    table.cell(3, 1).text = "  padded  "
+    table.cell(3, 2).add_table(rows=1, cols=1).cell(0, 0).text = "nested"
+    table.cell(3, 2).add_paragraph().add_run().add_break(WD_BREAK.PAGE)
+
+    section = doc.add_section(WD_SECTION.NEW_PAGE)
+    section.header.is_linked_to_previous = False
+    section.header.paragraphs[0].text = "Appendix"
+    doc.add_paragraph("last")
+
+    doc.save(file_path)
+
+
+def python_docx_content(file_path):
+    """
+    Reference extraction through python-docx's Document(), in the structure of
+    oscar_etl.read_docx_content.
+    """
+    from docx import Document
+
+    doc = Document(file_path)
+    content = {
+        "paragraphs": [para.text for para in doc.paragraphs],
+        "tables": [[[cell.text.strip() for cell in row.cells] for row in table.rows] for table in doc.tables],
+        "headers_footers": [],
+    }
+    for section_idx, section in enumerate(doc.sections, start=1):
+        for kind, part in (("Header", section.header), ("Footer", section.footer)):
+            if part and part.paragraphs:
+                content["headers_footers"].append((section_idx, kind, [para.text for para in part.paragraphs]))
+    return content
+
+
+def check_parser_parity(file_paths):
+    """
+    Compares the selective DOCX loader with python-docx on every file.
+
+    Returns:
+        list: Paths whose extracted content differs.
+    """
+    import oscar_etl
+
+    mismatches = []
+    for file_path in file_paths:
+        if oscar_etl.read_docx_content(file_path) != python_docx_content(file_path):
+            mismatches.append(file_path)
+    return mismatches
+
+
+# ----------------------------
+# Benchmarks
+# ----------------------------
+
+def benchmark_parsing(reports):
+    """
+    Parses every report through the version dispatcher.
+
+    Returns:
+        dict: reports_per_sec and variants_per_sec, counting the variants
+        parse_variants extracted (not the ones generated).
+    """
+    import oscar_etl
+
+    variant_count = 0
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        for file_path, _ in reports:
+            content = oscar_etl.dispatch_parser_by_version(file_path)
+            variant_count += len(oscar_etl.parse_variants(content))
+    elapsed = time.perf_counter() - start
+
+    return {
+        "reports_per_sec": len(reports) / elapsed,
+        "variants_per_sec": variant_count / elapsed,
+    }
+
+
+def benchmark_loading(dsn, sample_names, directory):
+    """
+    Loads PERSON, PROCEDURE_OCCURRENCE, SPECIMEN and GENOMIC_TEST rows for
+    every sample into a temporary schema with parse.load_sample, the
+    per-sample step of the bin/parse.py load loop.
+
+    Rows are counted from the rows_inserted.* counters of the run, and the
+    benchmark fails if any insert_errors.* counter moved.
+
+    Returns:
+        dict: rows_per_sec.
+    """
+    import psycopg2
+    import parse
+    from oscar_metrics import COUNTERS
+
+    version_file = os.path.join(directory, "pipeline_version.txt")
+    with open(version_file, "w") as f:
+        for index, sample_name in enumerate(sample_names):
+            f.write(f"v5.{index % 3} {sample_name}\n")
+    parse.PIPELINE_VERSION_FILE = version_file
+    parse.GENOMIC_TEST_REGISTRY.clear()
+
+    schema = f"oscar_benchmark_{os.getpid()}"
+    conn = psycopg2.connect(dsn)
+    try:
+        with conn.cursor() as cur:
+            cur.execute(f"CREATE SCHEMA {schema}")
+            cur.execute(f"SET search_path TO {schema}")
+            cur.execute(BENCHMARK_SCHEMA_DDL)
+        conn.commit()
+
+        counters_before = dict(COUNTERS)
+        seen_persons = set()
+        start = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            for sample_name in sample_names:
+                parse.load_sample(sample_name, conn, seen_persons)
+        elapsed = time.perf_counter() - start
+    finally:
+        conn.rollback()
+        with conn.cursor() as cur:
+            cur.execute(f"DROP SCHEMA IF EXISTS {schema} CASCADE")
+        conn.commit()
+        conn.close()
+
+    counts = {name: value - counters_before.get(name, 0) for name, value in COUNTERS.items()}
+    errors = {name: count for name, count in counts.items() if name.startswith("insert_errors.") and count}
+    if errors:
+        raise RuntimeError(f"Loading benchmark had failed inserts: {errors}")
+    rows = sum(count for name, count in counts.items() if name.startswith("rows_inserted."))
+
+    return {"rows_per_sec": rows / elapsed}
+
+
+# ----------------------------
+# Baselines
+# ----------------------------
+
+# Arguments shaping the synthetic workload; results are only comparable when they match
+BASELINE_PARAMETERS = ("reports", "variants", "samples", "seed")
+
+
+def compare_to_baseline(results, baseline, tolerance):
+    """
+    Compares throughput metrics with a saved baseline.
+
+    Returns:
+        list: Human-readable descriptions of the metrics that regressed.
+    """
+    regressions = []
+    for metric, value in results.items():
+        reference = baseline.get(metric)
+        if reference and value < reference * (1 - tolerance):
+            regressions.append(f"{metric}: {value:.1f} vs baseline {reference:.1f} ({value / reference - 1:+.0%})")
+    return regressions
+
+
+# ----------------------------
+# Main Function
+# ----------------------------
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark report parsing and OMOP loading on synthetic data")
+    parser.add_argument("--reports", type=int, default=60, help="Number of synthetic reports to parse")
+    parser.add_argument("--variants", type=int, default=20, help="Variants per synthetic report")
+    parser.add_argument("--samples", type=int, default=1000, help="Number of synthetic samples to load")
+    parser.add_argument("--dsn", help="Connection string of a throwaway PostgreSQL database; loading is skipped without it")
+    parser.add_argument("--seed", type=int, default=0, help="Random seed for the synthetic data")
+    parser.add_argument("--baseline", help="Baseline JSON to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Allowed relative drop before a metric counts as a regression")
+    parser.add_argument("--save-baseline", help="Write the results to this JSON file")
+    parser.add_argument("--metrics", help="Write the per-stage timings of the run to this file (*.prom or JSON)")
+    parser.add_argument("--check-parity", action="store_true", help="Check the DOCX loader against python-docx before benchmarking")
+    args = parser.parse_args()
+
+    parameters = {name: getattr(args, name) for name in BASELINE_PARAMETERS}
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        if baseline.get("parameters") != parameters:
+            print(f"Baseline {args.baseline} was recorded with {baseline.get('parameters')}, this run uses {parameters}; not comparing.")
+            sys.exit(1)
+
+    results = {}
+    with tempfile.TemporaryDirectory(prefix="oscar_benchmark_") as directory:
+        reports = generate_reports(directory, args.reports, args.variants, args.seed) if args.reports else []
+
+        if args.check_parity:
+            parity_report = os.path.join(directory, "parity_V6.docx")
+            generate_parity_report(parity_report)
+            mismatches = check_parser_parity([parity_report] + [file_path for file_path, _ in reports])
+            if mismatches:
+                print("DOCX loader differs from python-docx on:")
+                for file_path in mismatches:
+                    print(f"  {os.path.basename(file_path)}")
+                sys.exit(1)
+            print("DOCX loader matches python-docx.")
+
+            # Parity parsing is not part of the measured run
+            from oscar_metrics import reset
+            reset()
+
+        if reports:
+            results.update(benchmark_parsing(reports))
+        if args.dsn and args.samples:
+            sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+            results.update(benchmark_loading(args.dsn, generate_sample_names(args.samples, args.seed), directory))
+
+    for metric, value in results.items():
+        print(f"{metric}: {value:.1f}")
+
+    if args.metrics:
+        from oscar_metrics import write_metrics
+        write_metrics(args.metrics)
+
+    if args.save_baseline:
+        with open(args.save_baseline, "w") as f:
+            json.dump({"parameters": parameters, "results": results}, f, indent=2)
+        print(f"Baseline saved to {args.save_baseline}")
+
+    if baseline is not None:
+        regressions = compare_to_baseline(results, baseline["results"], args.tolerance)
+        if regressions:
+            print("Regressions against baseline:")
+            for regression in regressions:
+                print(f"  {regression}")
+            sys.exit(1)
+        print("No regressions against baseline.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,206 @@
+"""
+===========================================================
+OSCAR-DREAM OMOP Vocabulary Index
+===========================================================
+
+Description:
+-------------
+Offline (vocabulary_id, concept_code) -> concept_id index built from an
+Athena CONCEPT.csv export. The index is a single binary file holding two
+sorted fixed-width arrays (64-bit key hashes and concept ids). It is opened
+with mmap, so startup only maps the file and every worker process shares
+the same page cache pages.
+
+Usage:
+------
+$ python omop_vocabulary.py build CONCEPT.csv concept.idx
+$ python omop_vocabulary.py lookup concept.idx Gender F M
+===========================================================
+"""
+
+import argparse
+import bisect
+import csv
+import hashlib
+import mmap
+import struct
+import sys
+from array import array
+
+
+MAGIC = b"OMOPVOC1"
+# magic, byte order flag (0 = little, 1 = big), record count
+HEADER = struct.Struct("<8sBxxxxxxxQ")
+
+
+def concept_key(vocabulary_id, concept_code):
+    """
+    Hashes a (vocabulary_id, concept_code) pair into an unsigned 64-bit key.
+
+    Parameters:
+        vocabulary_id (str): OMOP vocabulary, e.g. "Gender" or "SNOMED".
+        concept_code (str): Source code within the vocabulary.
+
+    Returns:
+        int: 64-bit key.
+    """
+    digest = hashlib.blake2b(f"{vocabulary_id}\x1f{concept_code}".encode(), digest_size=8).digest()
+    return int.from_bytes(digest, "little")
+
+
+def code_check(vocabulary_id, concept_code):
+    """
+    Independent 32-bit hash of a (vocabulary_id, concept_code) pair, telling
+    apart pairs whose concept_key collides without keeping the codes.
+    """
+    digest = hashlib.blake2b(f"{vocabulary_id}\x1f{concept_code}".encode(), digest_size=4, person=b"omopchk").digest()
+    return int.from_bytes(digest, "little")
+
+
+def build_vocabulary_index(concept_csv, index_path, delimiter="\t"):
+    """
+    Builds the on-disk index from an Athena CONCEPT.csv export.
+
+    When a (vocabulary_id, concept_code) pair appears more than once the
+    standard concept is kept, otherwise the first one seen.
+
+    Parameters:
+        concept_csv (str): Path to CONCEPT.csv (tab separated, as shipped by Athena).
+        index_path (str): Output path of the index file.
+        delimiter (str): Field delimiter of the export.
+
+    Returns:
+        int: Number of concepts written.
+    """
+    # key -> code_check << 32 | concept_id << 1 | standard, one int per concept
+    # (a full Athena export has millions of them, so no code strings are kept)
+    entries = {}
+    csv.field_size_limit(sys.maxsize)
+    with open(concept_csv, "r", newline="", encoding="utf-8") as f:
+        reader = csv.DictReader(f, delimiter=delimiter, quoting=csv.QUOTE_NONE)
+        for row in reader:
+            vocabulary_id = row["vocabulary_id"]
+            concept_code = row["concept_code"]
+            key = concept_key(vocabulary_id, concept_code)
+            check = code_check(vocabulary_id, concept_code)
+            standard = row.get("standard_concept") == "S"
+            concept_id = int(row["concept_id"])
+            if not 0 <= concept_id < 1 << 31:
+                raise ValueError(f"concept_id {concept_id} of {(vocabulary_id, concept_code)} is out of range")
+            previous = entries.get(key)
+            if previous is not None:
+                if previous >> 32 != check:
+                    raise ValueError(f"Key collision between {(vocabulary_id, concept_code)} and an earlier code")
+                if previous & 1 or not standard:
+                    continue
+            entries[key] = check << 32 | concept_id << 1 | standard
+
+    keys = array("Q", sorted(entries))
+    concept_ids = array("q", (entries[key] >> 1 & 0x7FFFFFFF for key in keys))
+
+    with open(index_path, "wb") as f:
+        f.write(HEADER.pack(MAGIC, 0 if sys.byteorder == "little" else 1, len(keys)))
+        keys.tofile(f)
+        concept_ids.tofile(f)
+
+    return len(keys)
+
+
+class VocabularyIndex:
+    """
+    Read-only, memory-mapped view over an index built by build_vocabulary_index.
+    """
+
+    def __init__(self, index_path):
+        with open(index_path, "rb") as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, byteorder, count = HEADER.unpack_from(self._mmap, 0)
+        if magic != MAGIC:
+            raise ValueError(f"{index_path} is not an OMOP vocabulary index")
+        if byteorder != (0 if sys.byteorder == "little" else 1):
+            raise ValueError(f"{index_path} was built on a machine with a different byte order")
+
+        self._view = memoryview(self._mmap)
+        start = HEADER.size
+        middle = start + count * 8
+        self._keys = self._view[start:middle].cast("Q")
+        self._concept_ids = self._view[middle:middle + count * 8].cast("q")
+
+    def __len__(self):
+        return len(self._keys)
+
+    def lookup(self, vocabulary_id, concept_code):
+        """
+        Resolves a single code.
+
+        Returns:
+            int: concept_id, or None if the code is not in the index.
+        """
+        key = concept_key(vocabulary_id, concept_code)
+        position = bisect.bisect_left(self._keys, key)
+        if position < len(self._keys) and self._keys[position] == key:
+            return self._concept_ids[position]
+        return None
+
+    def lookup_column(self, vocabulary_id, concept_codes):
+        """
+        Resolves a whole column of codes from one vocabulary.
+
+        Each distinct code is searched once, so repeated values (gender,
+        specimen type, ...) cost a dictionary hit rather than a search.
+
+        Parameters:
+            vocabulary_id (str): OMOP vocabulary of every code in the column.
+            concept_codes (iterable): Codes, e.g. a list or pandas Series.
+
+        Returns:
+            list: concept_id per code, None where the code is unknown.
+        """
+        resolved = {}
+        concept_ids = []
+        for concept_code in concept_codes:
+            if concept_code not in resolved:
+                resolved[concept_code] = self.lookup(vocabulary_id, concept_code)
+            concept_ids.append(resolved[concept_code])
+        return concept_ids
+
+    def close(self):
+        self._keys.release()
+        self._concept_ids.release()
+        self._view.release()
+        self._mmap.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build or query the offline OMOP vocabulary index")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    build = subparsers.add_parser("build", help="Build the index from an Athena CONCEPT.csv export")
+    build.add_argument("concept_csv", help="Path to CONCEPT.csv")
+    build.add_argument("index_path", help="Output index file")
+
+    lookup = subparsers.add_parser("lookup", help="Resolve codes against an existing index")
+    lookup.add_argument("index_path", help="Index file")
+    lookup.add_argument("vocabulary_id", help="Vocabulary of the codes, e.g. Gender")
+    lookup.add_argument("concept_codes", nargs="+", help="Codes to resolve")
+
+    args = parser.parse_args()
+
+    if args.command == "build":
+        count = build_vocabulary_index(args.concept_csv, args.index_path)
+        print(f"Indexed {count} concepts into {args.index_path}")
+    else:
+        with VocabularyIndex(args.index_path) as index:
+            for concept_code, concept_id in zip(args.concept_codes, index.lookup_column(args.vocabulary_id, args.concept_codes)):
+                print(f"{args.vocabulary_id}\t{concept_code}\t{concept_id}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,4 +1,20 @@
 import psycopg2
+import argparse
+import hashlib
+import logging
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from multiprocessing import Pool
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+from oscar_metrics import timed, increment, write_metrics
+
+logger = logging.getLogger(__name__)
+
+# Pipeline version per sample, "<version> <sample name>" per line
+PIPELINE_VERSION_FILE = "/mnt/oscar-dream/data/oscar_pipeline_version.txt"
 
 def insert_care_site(care_site_id, care_site_name, place_of_service, location_id, conn):
     """
@@ -16,12 +32,16 @@ def insert_care_site(care_site_id, care_site_name, place_of_service, location_id
     """
     try:
         with conn.cursor() as cur:
-            cur.execute(query, (care_site_id, care_site_name, place_of_service, location_id))
-            conn.commit()
-            print("Care Site inserted successfully.")
+            with timed("db_execute"):
+                cur.execute(query, (care_site_id, care_site_name, place_of_service, location_id))
+            with timed("db_commit"):
+                conn.commit()
+            increment("rows_inserted.CARE_SITE")
+            logger.debug("Care Site inserted successfully.")
     except Exception as e:
         conn.rollback()
-        print("Error inserting record:", e)
+        increment("insert_errors.CARE_SITE")
+        logger.error("Error inserting record: %s", e)
 
 def insert_person(person_id, gender, birth_year, race, care_site_id, conn):
     """
@@ -40,12 +60,16 @@ def insert_person(person_id, gender, birth_year, race, care_site_id, conn):
 
     try:
         with conn.cursor() as cur:
-            cur.execute(query, (person_id, gender, birth_year, race, care_site_id))            
-            conn.commit()
-            print("Person inserted successfully")
+            with timed("db_execute"):
+                cur.execute(query, (person_id, gender, birth_year, race, care_site_id))
+            with timed("db_commit"):
+                conn.commit()
+            increment("rows_inserted.PERSON")
+            logger.debug("Person inserted successfully")
     except Exception as e:
         conn.rollback()
-        print("Error inserting person:", e)
+        increment("insert_errors.PERSON")
+        logger.error("Error inserting person: %s", e)
 
 
 
@@ -66,12 +90,16 @@ def insert_specimen(person_id, procedure_occurrence_id, specimen_concept_id, spe
     
     try:
         with conn.cursor() as cur:
-            cur.execute(query, (person_id, procedure_occurrence_id, specimen_concept_id, specimen_date, anatomic_site, disease_status))           
-            conn.commit()
-            print("Specimen inserted successfully")
+            with timed("db_execute"):
+                cur.execute(query, (person_id, procedure_occurrence_id, specimen_concept_id, specimen_date, anatomic_site, disease_status))
+            with timed("db_commit"):
+                conn.commit()
+            increment("rows_inserted.SPECIMEN")
+            logger.debug("Specimen inserted successfully")
     except Exception as e:
         conn.rollback()
-        print("Error inserting specimen:", e)
+        increment("insert_errors.SPECIMEN")
+        logger.error("Error inserting specimen: %s", e)
 
 def insert_genomic_test(genomic_test_id, care_site_id, genomic_test_name, genomic_test_version, 
                         reference_genome, sequencing_device, target_capture, read_type, read_length, 
@@ -79,26 +107,37 @@ def insert_genomic_test(genomic_test_id, care_site_id, genomic_test_name, genomi
                         annotation_databases, conn):
     """
     Inserts a genomic test into the GENOMIC_TEST table.
+
+    A test already loaded by an earlier run (same genomic_test_id) is skipped.
+
+    :return: True if the row is in the table after the call, False on error
     """
     query = """
     INSERT INTO GENOMIC_TEST (
         genomic_test_id, care_site_id, genomic_test_name, genomic_test_version, reference_genome, 
         sequencing_device, target_capture, read_type, read_length, alignment_tools, 
         variant_calling_tools, chromosome_coordinate, annotation_tools, annotation_databases
-    ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s);
+    ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+    ON CONFLICT (genomic_test_id) DO NOTHING;
     """
     
     try:
         with conn.cursor() as cur:
-            cur.execute(query, (genomic_test_id, care_site_id, genomic_test_name, genomic_test_version, 
-                                reference_genome, sequencing_device, target_capture, read_type, read_length, 
-                                alignment_tools, variant_calling_tools, chromosome_coordinate, 
-                                annotation_tools, annotation_databases))
-            conn.commit()
-            print("Genomic test inserted successfully")
+            with timed("db_execute"):
+                cur.execute(query, (genomic_test_id, care_site_id, genomic_test_name, genomic_test_version,
+                                    reference_genome, sequencing_device, target_capture, read_type, read_length,
+                                    alignment_tools, variant_calling_tools, chromosome_coordinate,
+                                    annotation_tools, annotation_databases))
+            with timed("db_commit"):
+                conn.commit()
+            increment("rows_inserted.GENOMIC_TEST", cur.rowcount)
+            logger.debug("Genomic test inserted successfully")
+            return True
     except Exception as e:
         conn.rollback()
-        print("Error inserting genomic test:", e)
+        increment("insert_errors.GENOMIC_TEST")
+        logger.error("Error inserting genomic test: %s", e)
+        return False
 
 
 def insert_target_gene(target_gene_id, genomic_test_id, hgnc_id, chromosome, start_position, end_position, conn):
@@ -113,12 +152,16 @@ def insert_target_gene(target_gene_id, genomic_test_id, hgnc_id, chromosome, sta
     
     try:
         with conn.cursor() as cur:
-            cur.execute(query, (target_gene_id, genomic_test_id, hgnc_id, chromosome, start_position, end_position))
-            conn.commit()
-            print("Target gene inserted successfully")
+            with timed("db_execute"):
+                cur.execute(query, (target_gene_id, genomic_test_id, hgnc_id, chromosome, start_position, end_position))
+            with timed("db_commit"):
+                conn.commit()
+            increment("rows_inserted.TARGET_GENE")
+            logger.debug("Target gene inserted successfully")
     except Exception as e:
         conn.rollback()
-        print("Error inserting target gene:", e)
+        increment("insert_errors.TARGET_GENE")
+        logger.error("Error inserting target gene: %s", e)
 
 def insert_variant_occurrence( variant_occurrence_id, procedure_occurrence_id, specimen_id, reference_specimen_id, target_gene_id, reference_sequence, rs_id, hgvs_c, hgvs_p, variant_read_depth , total_read_depth, variant_exon_number, sequence_alteration,variant_feature, conn):
     """
@@ -132,36 +175,89 @@ def insert_variant_occurrence( variant_occurrence_id, procedure_occurrence_id, s
     
     try:
         with conn.cursor() as cur:
-            cur.execute(query, (variant_occurrence_id, procedure_occurrence_id, specimen_id, reference_specimen_id, target_gene_id, reference_sequence, rs_id, hgvs_c, hgvs_p, variant_read_depth , total_read_depth, variant_exon_number, sequence_alteration,variant_feature, ))
-            conn.commit()
-            print("Variant occurrence inserted successfully")
+            with timed("db_execute"):
+                cur.execute(query, (variant_occurrence_id, procedure_occurrence_id, specimen_id, reference_specimen_id, target_gene_id, reference_sequence, rs_id, hgvs_c, hgvs_p, variant_read_depth , total_read_depth, variant_exon_number, sequence_alteration,variant_feature, ))
+            with timed("db_commit"):
+                conn.commit()
+            increment("rows_inserted.VARIANT_OCCURRENCE")
+            logger.debug("Variant occurrence inserted successfully")
     except Exception as e:
         conn.rollback()
-        print("Error inserting variant occurrence:", e)
+        increment("insert_errors.VARIANT_OCCURRENCE")
+        logger.error("Error inserting variant occurrence: %s", e)
 
 def insert_variant_annotation(variant_annotation_id, variant_occurrence_id, annotation_database, 
                               variant_origin, variant_pathogenicity, variant_class_level, allele_frequency, 
                               medication, clinical_trial_information, conn):
     """
     Inserts a variant annotation into the VARIANT_ANNOTATION table.
+
+    The annotation payload (database, origin, pathogenicity, class level,
+    medication, clinical trial) repeats across many variants, so it is
+    interned in VARIANT_ANNOTATION_PAYLOAD and the row only stores its
+    annotation_payload_id next to the per-variant allele frequency.
+    The VARIANT_ANNOTATION_DECODED view joins them back.
+
+    Requires the schema change of --migrate-annotation-schema.
     """
+    annotation_payload_id = register_annotation_payload(annotation_database, variant_origin, variant_pathogenicity,
+                                                        variant_class_level, medication, clinical_trial_information, conn)
+    if annotation_payload_id is None:
+        # The row would reference a payload that never landed
+        increment("insert_errors.VARIANT_ANNOTATION")
+        logger.error("Skipping variant annotation %s: its annotation payload could not be inserted", variant_annotation_id)
+        return
     query = """
     INSERT INTO VARIANT_ANNOTATION (
-        variant_annotation_id, variant_occurrence_id, annotation_database, variant_origin, 
-        variant_pathogenicity, variant_class_level, allele_frequency, medication, clinical_trial_information
-    ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s);
+        variant_annotation_id, variant_occurrence_id, annotation_payload_id, allele_frequency
+    ) VALUES (%s, %s, %s, %s);
     """
     
     try:
         with conn.cursor() as cur:
-            cur.execute(query, (variant_annotation_id, variant_occurrence_id, annotation_database, 
-                                variant_origin, variant_pathogenicity, variant_class_level, allele_frequency, 
-                                medication, clinical_trial_information))
-            conn.commit()
-            print("Variant annotation inserted successfully")
+            with timed("db_execute"):
+                cur.execute(query, (variant_annotation_id, variant_occurrence_id, annotation_payload_id, allele_frequency))
+            with timed("db_commit"):
+                conn.commit()
+            increment("rows_inserted.VARIANT_ANNOTATION")
+            logger.debug("Variant annotation inserted successfully")
     except Exception as e:
         conn.rollback()
-        print("Error inserting variant annotation:", e)
+        increment("insert_errors.VARIANT_ANNOTATION")
+        logger.error("Error inserting variant annotation: %s", e)
+
+def insert_annotation_payload(annotation_payload_id, annotation_database, variant_origin, variant_pathogenicity,
+                              variant_class_level, medication, clinical_trial_information, conn):
+    """
+    Inserts a distinct annotation payload into the VARIANT_ANNOTATION_PAYLOAD table.
+
+    Payload IDs are content derived, so a payload already loaded by an earlier run is skipped.
+
+    :return: True if the payload is in the table, False if the insert failed
+    """
+    query = """
+    INSERT INTO VARIANT_ANNOTATION_PAYLOAD (
+        annotation_payload_id, annotation_database, variant_origin, variant_pathogenicity,
+        variant_class_level, medication, clinical_trial_information
+    ) VALUES (%s, %s, %s, %s, %s, %s, %s)
+    ON CONFLICT (annotation_payload_id) DO NOTHING;
+    """
+
+    try:
+        with conn.cursor() as cur:
+            with timed("db_execute"):
+                cur.execute(query, (annotation_payload_id, annotation_database, variant_origin, variant_pathogenicity,
+                                    variant_class_level, medication, clinical_trial_information))
+            with timed("db_commit"):
+                conn.commit()
+            increment("rows_inserted.VARIANT_ANNOTATION_PAYLOAD", cur.rowcount)
+            logger.debug("Variant annotation payload inserted successfully")
+            return True
+    except Exception as e:
+        conn.rollback()
+        increment("insert_errors.VARIANT_ANNOTATION_PAYLOAD")
+        logger.error("Error inserting variant annotation payload: %s", e)
+        return False
 
 def insert_condition_occurrence(condition_occurrence_id, person_id, condition_concept_id, condition_start_date, 
                                 condition_end_date, condition_type_concept_id, stop_reason, conn):
@@ -177,14 +273,18 @@ def insert_condition_occurrence(condition_occurrence_id, person_id, condition_co
     
     try:
         with conn.cursor() as cur:
-            cur.execute(query, (condition_occurrence_id, person_id, condition_concept_id, 
-                                condition_start_date, condition_end_date, condition_type_concept_id, 
-                                stop_reason))
-            conn.commit()
-            print("Condition occurrence inserted successfully")
+            with timed("db_execute"):
+                cur.execute(query, (condition_occurrence_id, person_id, condition_concept_id,
+                                    condition_start_date, condition_end_date, condition_type_concept_id,
+                                    stop_reason))
+            with timed("db_commit"):
+                conn.commit()
+            increment("rows_inserted.CONDITION_OCCURRENCE")
+            logger.debug("Condition occurrence inserted successfully")
     except Exception as e:
         conn.rollback()
-        print("Error inserting condition occurrence:", e)
+        increment("insert_errors.CONDITION_OCCURRENCE")
+        logger.error("Error inserting condition occurrence: %s", e)
 
 def insert_procedure_occurrence( person_id, procedure_concept_id, procedure_date, 
                                 procedure_type_concept_id, conn):
@@ -201,17 +301,73 @@ def insert_procedure_occurrence( person_id, procedure_concept_id, procedure_date
     
     try:
         with conn.cursor() as cur:
-            cur.execute(query, ( person_id, procedure_concept_id, 
-                                procedure_date, procedure_type_concept_id))
+            with timed("db_execute"):
+                cur.execute(query, ( person_id, procedure_concept_id,
+                                    procedure_date, procedure_type_concept_id))
             procedure_occurrence_id = cur.fetchone()[0]
-            conn.commit()
-            print("Procedure occurrence inserted successfully with ID:", procedure_occurrence_id)
+            with timed("db_commit"):
+                conn.commit()
+            increment("rows_inserted.PROCEDURE_OCCURRENCE")
+            logger.debug("Procedure occurrence inserted successfully with ID: %s", procedure_occurrence_id)
             return procedure_occurrence_id            
     except Exception as e:
         conn.rollback()
-        print("Error inserting procedure occurrence:", e)
+        increment("insert_errors.PROCEDURE_OCCURRENCE")
+        logger.error("Error inserting procedure occurrence: %s", e)
+
+
+
+# Source code of every concept written by the loader: name -> (vocabulary_id, concept_code, fallback concept_id).
+# The fallbacks are used as-is unless a vocabulary index is given (--vocabulary, see load_concepts).
+CONCEPT_CODES = {
+    "gender_female": ("Gender", "F", 8532),
+    "gender_male": ("Gender", "M", 8507),
+    "specimen": ("SNOMED", "119297000", 46274042),  # blood specimen
+    "anatomic_site": ("SNOMED", "87612001", 40461907),  # blood
+    "disease_status": ("SNOMED", "17621005", 4069590),  # normal
+    "procedure": ("CPT4", "81425", 46257601),  # genome sequence analysis
+    "procedure_type": ("Procedure Type", "OMOP4822262", 44786630),  # primary procedure
+}
+
+# Concept IDs in use, name -> concept_id
+CONCEPT_IDS = {name: fallback for name, (_, _, fallback) in CONCEPT_CODES.items()}
 
+def use_concepts(concept_ids: dict):
+    """
+    Installs concept IDs resolved elsewhere; the Pool initializer of
+    export_bundle, so workers use the parent's CONCEPT_IDS without
+    reopening the index (or logging its warnings once per worker).
+    """
+    CONCEPT_IDS.update(concept_ids)
+
+def load_concepts(index_path: str = None):
+    """
+    Resolves CONCEPT_CODES against an offline vocabulary index built by
+    bin/omop_vocabulary.py, one lookup_column call per vocabulary.
+    Codes missing from the index keep their fallback concept_id.
 
+    :param index_path: Vocabulary index file, None to keep the fallbacks
+    """
+    if index_path is None:
+        return
+
+    from omop_vocabulary import VocabularyIndex
+
+    codes_by_vocabulary = {}
+    for name, (vocabulary_id, concept_code, _) in CONCEPT_CODES.items():
+        codes_by_vocabulary.setdefault(vocabulary_id, []).append((name, concept_code))
+
+    with VocabularyIndex(index_path) as index:
+        for vocabulary_id, codes in codes_by_vocabulary.items():
+            concept_ids = index.lookup_column(vocabulary_id, [concept_code for _, concept_code in codes])
+            for (name, concept_code), concept_id in zip(codes, concept_ids):
+                fallback = CONCEPT_CODES[name][2]
+                if concept_id is None:
+                    logger.warning("%s code %s is not in %s, using concept %d", vocabulary_id, concept_code, index_path, fallback)
+                    concept_id = fallback
+                elif concept_id != fallback:
+                    logger.warning("%s code %s resolves to concept %d instead of %d", vocabulary_id, concept_code, concept_id, fallback)
+                CONCEPT_IDS[name] = concept_id
 
 def extract_age_gender(sample_name: str):
 
@@ -225,9 +381,9 @@ def extract_age_gender(sample_name: str):
         #current_year = datetime.now().year
         #age = current_year - birth_year
         if gender == "f":
-            gender_omop = 8532
+            gender_omop = CONCEPT_IDS["gender_female"]
         if gender =="m":
-            gender_omop = 8507
+            gender_omop = CONCEPT_IDS["gender_male"]
         return birth_year, gender_omop
     return None, None
 
@@ -321,12 +477,28 @@ def extract_prefix(filename: str) -> str:
     match = re.match(r"^(\w+)-", filename)
     return match.group(1) if match else None    
 
-def get_pipeline_version(file_path: str, sample_name: str) -> str:
+@lru_cache(maxsize=None)
+def read_pipeline_versions(file_path: str):
+    """
+    Reads the pipeline version file once per run.
+
+    :return: dict of sample name -> pipeline version, and the (version, name) pairs in file order
+    """
     with open(file_path, "r") as f:
-        for line in f:
-            parts = line.strip().split()
-            if len(parts) == 2 and parts[1].startswith(sample_name):
-                return parts[0]  # Return pipeline version
+        pairs = tuple(tuple(parts) for parts in (line.strip().split() for line in f) if len(parts) == 2)
+    versions = {}
+    for version, name in pairs:
+        versions.setdefault(name, version)  # first line wins, as in the prefix scan
+    return versions, pairs
+
+def get_pipeline_version(file_path: str, sample_name: str) -> str:
+    versions, pairs = read_pipeline_versions(file_path)
+    if sample_name in versions:
+        return versions[sample_name]
+    # Fall back to the prefix match for names listed with a suffix
+    for version, name in pairs:
+        if name.startswith(sample_name):
+            return version  # Return pipeline version
     return None  # Return None if sample name not found
 
 def parse_person(sample_name: str):
@@ -377,10 +549,10 @@ def parse_procedure_occurence(sample_name: str):
 
     
     person_id=extract_prefix(sample_name)
-    procedure_concept_id=46257601
+    procedure_concept_id=CONCEPT_IDS["procedure"]
     procedure_date=convert_to_date(get_procedure_date(sample_name))
 
-    procedure_type_concept_id=44786630 #hard coded ( genomic sequence procedure )
+    procedure_type_concept_id=CONCEPT_IDS["procedure_type"] # genomic sequence procedure
     return person_id, procedure_concept_id, procedure_date, procedure_type_concept_id
 
 def parse_specimen(sample_name: str):
@@ -390,10 +562,10 @@ def parse_specimen(sample_name: str):
     #malignant="4066212" 
     #normal ="4069590"  
       
-    specimen_concept_id=46274042
+    specimen_concept_id=CONCEPT_IDS["specimen"]
     specimen_date=convert_to_date(get_procedure_date(sample_name))
-    anatomic_site=40461907
-    disease_status=4069590
+    anatomic_site=CONCEPT_IDS["anatomic_site"]
+    disease_status=CONCEPT_IDS["disease_status"]
     return specimen_concept_id,specimen_date, anatomic_site, disease_status
 
 
@@ -407,8 +579,7 @@ def parse_genomic_test(sample_name: str):
     care_site_id=1 # hardcoded rigshospitalet 
     genomic_test_name="DGM_WGS" # hardcoded pipelinename, WGS_v1_IlluminaDNAPCRFree_X ?
      
-    filepath="/mnt/oscar-dream/data/oscar_pipeline_version.txt" 
-    genomic_test_version=get_pipeline_version(filepath,sample_name)    
+    genomic_test_version=get_pipeline_version(PIPELINE_VERSION_FILE,sample_name)    
 
     reference_genome="GRC38"# vcf 
     sequencing_device="Illumina NovaSeq6000"
@@ -422,7 +593,125 @@ def parse_genomic_test(sample_name: str):
     annotation_databases="ensembl-io_104.1d3bb6e, ensembl-funcgen_104.f1c7762, ensembl_104.1af1dce, ensembl-variation_104.6154f8b, Cosmic_92, Clinvar_20210102, ESP_V2-SSA137, HGMD-PUBLIC_20204, assembly_GRCh38.p13, dbSNP_154, gencode_GENCODE-38,  genebuild_2014-07, gnomAD_r2.1.1, polyphen_2.2.2, sift_sift5.2.2"
     
     return genomic_test_id, care_site_id, genomic_test_name, genomic_test_version, reference_genome, sequencing_device, target_capture, read_type, read_length, alignment_tools, variant_calling_tools, chromosome_coordinate, annotation_tools, annotation_databases
- 
+
+
+# Distinct genomic test configurations seen in this run, content key -> genomic_test_id
+GENOMIC_TEST_REGISTRY = {}
+
+def content_id(text: str) -> int:
+    """
+    Stable 60-bit ID derived from text (first 15 hex digits of its SHA-256).
+    Every content-derived ID of the loader and the export goes through here.
+    """
+    return int(hashlib.sha256(text.encode()).hexdigest()[:15], 16)
+
+def genomic_test_key(genomic_test) -> str:
+    """
+    Content key of a parsed genomic test, ignoring its genomic_test_id.
+    """
+    return "\x1f".join("" if field is None else str(field) for field in genomic_test[1:])
+
+def register_genomic_test(sample_name: str, conn):
+    """
+    Registers the genomic test configuration of a sample in the GENOMIC_TEST table.
+
+    Samples run with the same configuration (in practice the same pipeline
+    version) map to one row, inserted the first time the configuration is
+    seen in the run. The ID is derived from the content hash, so it is
+    stable across runs. No loaded table links a sample to its test yet;
+    the ID is returned for callers that write one (e.g. TARGET_GENE rows).
+
+    :param sample_name: Sample name as listed in the cohort file
+    :param conn: Active PostgreSQL database connection
+    :return: genomic_test_id of the sample
+    """
+    genomic_test = parse_genomic_test(sample_name)
+    content_key = genomic_test_key(genomic_test)
+
+    genomic_test_id = GENOMIC_TEST_REGISTRY.get(content_key)
+    if genomic_test_id is None:
+        genomic_test_id = content_id(content_key)
+        # Failed inserts are not cached, so the next sample retries them
+        if insert_genomic_test(genomic_test_id, *genomic_test[1:], conn):
+            GENOMIC_TEST_REGISTRY[content_key] = genomic_test_id
+    return genomic_test_id
+
+
+# Dictionary encoding of VARIANT_ANNOTATION: payload lookup table plus a view restoring the full rows.
+# Applied once with --migrate-annotation-schema, never from the insert path, as it locks VARIANT_ANNOTATION.
+# The legacy wide payload columns stay for rows loaded before the migration; they are made nullable
+# so the narrow insert of insert_variant_annotation succeeds, and the view falls back to them.
+ANNOTATION_PAYLOAD_DDL = """
+CREATE TABLE IF NOT EXISTS VARIANT_ANNOTATION_PAYLOAD (
+    annotation_payload_id bigint PRIMARY KEY,
+    annotation_database text,
+    variant_origin text,
+    variant_pathogenicity text,
+    variant_class_level text,
+    medication text,
+    clinical_trial_information text
+);
+ALTER TABLE VARIANT_ANNOTATION ADD COLUMN IF NOT EXISTS annotation_payload_id bigint
+    REFERENCES VARIANT_ANNOTATION_PAYLOAD (annotation_payload_id);
+ALTER TABLE VARIANT_ANNOTATION
+    ALTER COLUMN annotation_database DROP NOT NULL,
+    ALTER COLUMN variant_origin DROP NOT NULL,
+    ALTER COLUMN variant_pathogenicity DROP NOT NULL,
+    ALTER COLUMN variant_class_level DROP NOT NULL,
+    ALTER COLUMN medication DROP NOT NULL,
+    ALTER COLUMN clinical_trial_information DROP NOT NULL;
+CREATE OR REPLACE VIEW VARIANT_ANNOTATION_DECODED AS
+SELECT va.variant_annotation_id, va.variant_occurrence_id,
+       coalesce(p.annotation_database, va.annotation_database) AS annotation_database,
+       coalesce(p.variant_origin, va.variant_origin) AS variant_origin,
+       coalesce(p.variant_pathogenicity, va.variant_pathogenicity) AS variant_pathogenicity,
+       coalesce(p.variant_class_level, va.variant_class_level) AS variant_class_level,
+       va.allele_frequency,
+       coalesce(p.medication, va.medication) AS medication,
+       coalesce(p.clinical_trial_information, va.clinical_trial_information) AS clinical_trial_information
+FROM VARIANT_ANNOTATION va
+LEFT JOIN VARIANT_ANNOTATION_PAYLOAD p USING (annotation_payload_id);
+"""
+
+# Distinct annotation payloads seen in this run, payload tuple -> annotation_payload_id
+ANNOTATION_PAYLOAD_REGISTRY = {}
+
+def create_annotation_payload_schema(conn):
+    """
+    Creates the VARIANT_ANNOTATION_PAYLOAD table and VARIANT_ANNOTATION_DECODED view if missing.
+
+    Run once per database (--migrate-annotation-schema), outside of a load.
+
+    :return: True if the schema was applied, False otherwise
+    """
+    try:
+        with conn.cursor() as cur:
+            cur.execute(ANNOTATION_PAYLOAD_DDL)
+        conn.commit()
+        logger.info("Annotation payload schema applied")
+        return True
+    except Exception as e:
+        conn.rollback()
+        logger.error("Error applying annotation payload schema: %s", e)
+        return False
+
+def register_annotation_payload(annotation_database, variant_origin, variant_pathogenicity,
+                                variant_class_level, medication, clinical_trial_information, conn):
+    """
+    Interns an annotation payload, inserting it the first time it is seen in this run.
+
+    :return: annotation_payload_id of the payload, None if it could not be inserted
+    """
+    payload = (annotation_database, variant_origin, variant_pathogenicity, variant_class_level, medication, clinical_trial_information)
+
+    annotation_payload_id = ANNOTATION_PAYLOAD_REGISTRY.get(payload)
+    if annotation_payload_id is None:
+        key = "\x1f".join("" if field is None else str(field) for field in payload)
+        annotation_payload_id = deterministic_id("VARIANT_ANNOTATION_PAYLOAD", key)
+        if not insert_annotation_payload(annotation_payload_id, *payload, conn):
+            return None
+        ANNOTATION_PAYLOAD_REGISTRY[payload] = annotation_payload_id
+    return annotation_payload_id
 
 def extract_target_gene():
     """
@@ -477,6 +766,202 @@ def extract_variant_annotation():
     return variant_annotation_id, variant_occurrence_id, annotation_database,variant_origin, variant_pathogenicity, variant_class_level, allele_frequency, medication, clinical_trial_information
 
 
+# ----------------------------
+# Offline Export (COPY bundle)
+# ----------------------------
+
+# Column order of every exported table, as written to <TABLE>.tsv
+EXPORT_TABLES = {
+    "CARE_SITE": ("care_site_id", "care_site_name", "place_of_service", "location_id"),
+    "PERSON": ("person_id", "gender", "birth_year", "race", "care_site_id"),
+    "PROCEDURE_OCCURRENCE": ("procedure_occurrence_id", "person_id", "procedure_concept_id", "procedure_date", "procedure_type_concept_id"),
+    "SPECIMEN": ("specimen_id", "person_id", "procedure_occurrence_id", "specimen_concept_id", "specimen_date", "anatomic_site", "disease_status"),
+    "GENOMIC_TEST": ("genomic_test_id", "care_site_id", "genomic_test_name", "genomic_test_version", "reference_genome",
+                     "sequencing_device", "target_capture", "read_type", "read_length", "alignment_tools",
+                     "variant_calling_tools", "chromosome_coordinate", "annotation_tools", "annotation_databases"),
+}
+
+# Dimension rows repeated across bundles (same care site, returning persons, content-derived genomic
+# test IDs): staged and merged with ON CONFLICT DO NOTHING. The per-sample tables are copied directly.
+SHARED_TABLES = ("CARE_SITE", "PERSON", "GENOMIC_TEST")
+
+def bundle_load_statements(table: str):
+    """
+    SQL loading one bundle table, around the COPY of its rows.
+
+    :param table: Table name from EXPORT_TABLES
+    :return: (statements before the COPY, COPY target, statements after the COPY)
+    """
+    columns = ", ".join(EXPORT_TABLES[table])
+    if table not in SHARED_TABLES:
+        return [], f"{table} ({columns})", []
+    staging = f"staging_{table.lower()}"
+    return (
+        [f"CREATE TEMP TABLE {staging} (LIKE {table} INCLUDING DEFAULTS) ON COMMIT DROP;"],
+        f"{staging} ({columns})",
+        [f"INSERT INTO {table} ({columns}) SELECT {columns} FROM {staging} ON CONFLICT DO NOTHING;"],
+    )
+
+def deterministic_id(table: str, key: str) -> int:
+    """
+    Stable 60-bit ID for a row, derived from its table and natural key,
+    so repeated exports of the same sample produce the same IDs.
+    """
+    return content_id(f"{table}\x1f{key}")
+
+def copy_text(value) -> str:
+    """
+    Formats a value for PostgreSQL COPY text format (NULL as \\N, escaped separators).
+    """
+    if value is None:
+        return "\\N"
+    return str(value).replace("\\", "\\\\").replace("\t", "\\t").replace("\n", "\\n").replace("\r", "\\r")
+
+def transform_sample(sample_name: str):
+    """
+    Builds the OMOP rows of one sample without touching the database.
+
+    :param sample_name: Sample name as listed in the cohort file
+    :return: dict of table name -> list of row tuples in EXPORT_TABLES column order
+    """
+    person_id, gender, birth_year, race, care_site_id = parse_person(sample_name)
+    _, procedure_concept_id, procedure_date, procedure_type_concept_id = parse_procedure_occurence(sample_name)
+    specimen_concept_id, specimen_date, anatomic_site, disease_status = parse_specimen(sample_name)
+    genomic_test = parse_genomic_test(sample_name)
+
+    procedure_occurrence_id = deterministic_id("PROCEDURE_OCCURRENCE", sample_name)
+    specimen_id = deterministic_id("SPECIMEN", sample_name)
+    genomic_test_id = content_id(genomic_test_key(genomic_test))
+
+    return {
+        "PERSON": [(person_id, gender, birth_year, race, care_site_id)],
+        "PROCEDURE_OCCURRENCE": [(procedure_occurrence_id, person_id, procedure_concept_id, procedure_date, procedure_type_concept_id)],
+        "SPECIMEN": [(specimen_id, person_id, procedure_occurrence_id, specimen_concept_id, specimen_date, anatomic_site, disease_status)],
+        "GENOMIC_TEST": [(genomic_test_id, *genomic_test[1:])],
+    }
+
+def write_table(export_dir: str, table: str, rows) -> int:
+    """
+    Writes the rows of one table to <export_dir>/<TABLE>.tsv in COPY text format.
+    """
+    path = os.path.join(export_dir, f"{table}.tsv")
+    with timed("export_write"), open(path, "w", encoding="utf-8", newline="\n") as f:
+        f.writelines("\t".join(copy_text(value) for value in row) + "\n" for row in rows)
+    increment(f"rows_exported.{table}", len(rows))
+    return len(rows)
+
+def export_bundle(sample_names, export_dir: str, workers: int = None, vocabulary: str = None):
+    """
+    Exports the OMOP rows of a sample list as a COPY-ready bundle.
+
+    Samples are transformed in a process pool and every table file is then
+    written by its own thread. IDs are derived from the sample names, so the
+    bundle is reproducible and can be loaded with load_bundle, or with
+    psql -f load.sql from inside the export directory. Both load in one
+    transaction and skip shared rows already in the database.
+
+    :param sample_names: Iterable of sample names
+    :param export_dir: Output directory, created if missing
+    :param workers: Number of transform processes (defaults to the CPU count)
+    :param vocabulary: Vocabulary index file resolving the concept IDs (see load_concepts), read once here
+    :return: dict of table name -> rows written
+    """
+    os.makedirs(export_dir, exist_ok=True)
+
+    care_site_id, care_site_name, place_of_service, location_id = extract_care_site()
+    tables = {table: [] for table in EXPORT_TABLES}
+    tables["CARE_SITE"].append((care_site_id, care_site_name, place_of_service, location_id))
+    seen_keys = {table: set() for table in EXPORT_TABLES}
+
+    load_concepts(vocabulary)
+
+    with timed("export_transform"), Pool(workers, initializer=use_concepts, initargs=(dict(CONCEPT_IDS),)) as pool:
+        # imap keeps input order, so the files are identical between runs
+        for sample_rows in pool.imap(transform_sample, sample_names, chunksize=256):
+            increment("samples_processed")
+            for table, rows in sample_rows.items():
+                for row in rows:
+                    # PERSON and GENOMIC_TEST rows are shared between samples
+                    if row[0] in seen_keys[table]:
+                        continue
+                    seen_keys[table].add(row[0])
+                    tables[table].append(row)
+
+    with ThreadPoolExecutor(max_workers=len(tables)) as executor:
+        futures = {table: executor.submit(write_table, export_dir, table, rows) for table, rows in tables.items()}
+        written = {table: future.result() for table, future in futures.items()}
+
+    with open(os.path.join(export_dir, "load.sql"), "w") as f:
+        # Stop at the first error, so the open transaction is rolled back rather than partially committed
+        f.write("\\set ON_ERROR_STOP on\nBEGIN;\n")
+        for table in EXPORT_TABLES:
+            before, target, after = bundle_load_statements(table)
+            f.write("".join(f"{statement}\n" for statement in before))
+            f.write(f"\\copy {target} FROM '{table}.tsv'\n")
+            f.write("".join(f"{statement}\n" for statement in after))
+        f.write("COMMIT;\n")
+
+    return written
+
+def load_bundle(export_dir: str, conn):
+    """
+    Loads a bundle written by export_bundle with one COPY per table, in a single transaction.
+
+    Rows of SHARED_TABLES go through a temporary staging table, so rows
+    loaded by an earlier bundle are skipped instead of failing the load.
+
+    :param export_dir: Directory holding the <TABLE>.tsv files
+    :param conn: Active PostgreSQL database connection
+    """
+    try:
+        with conn.cursor() as cur:
+            for table in EXPORT_TABLES:
+                before, target, after = bundle_load_statements(table)
+                path = os.path.join(export_dir, f"{table}.tsv")
+                with timed("db_copy"), open(path, "r", encoding="utf-8") as f:
+                    for statement in before:
+                        cur.execute(statement)
+                    cur.copy_expert(f"COPY {target} FROM STDIN", f)
+                    for statement in after:
+                        cur.execute(statement)
+                increment(f"rows_inserted.{table}", cur.rowcount)
+                logger.info("Copied %d rows into %s", cur.rowcount, table)
+        with timed("db_commit"):
+            conn.commit()
+    except Exception as e:
+        conn.rollback()
+        logger.error("Error loading bundle %s: %s", export_dir, e)
+        raise
+
+def load_sample(sample_name: str, conn, seen_persons: set):
+    """
+    Inserts the PERSON, PROCEDURE_OCCURRENCE, SPECIMEN and GENOMIC_TEST rows of one sample.
+
+    :param sample_name: Sample name as listed in the cohort file
+    :param conn: Active PostgreSQL database connection
+    :param seen_persons: person_ids already inserted in this run, updated in place;
+                         one PERSON row per person_id, as in export_bundle (the first sample of a person wins)
+    """
+    logger.debug("Processing: %s", sample_name)
+    increment("samples_processed")
+
+    with timed("regex_extraction"):
+        person_id, gender, birth_year, race, care_site_id = parse_person(sample_name)
+    if person_id not in seen_persons:
+        seen_persons.add(person_id)
+        insert_person(person_id, gender, birth_year, race, care_site_id, conn)
+
+    with timed("regex_extraction"):
+        person_id, procedure_concept_id, procedure_date, procedure_type_concept_id= parse_procedure_occurence(sample_name)
+    procedure_occurrence_id = insert_procedure_occurrence( person_id, procedure_concept_id, procedure_date, procedure_type_concept_id,conn)
+
+    with timed("regex_extraction"):
+        specimen_concept_id,specimen_date, anatomic_site, disease_status= parse_specimen(sample_name)
+    insert_specimen(person_id, procedure_occurrence_id, specimen_concept_id, specimen_date, anatomic_site, disease_status, conn)
+
+    register_genomic_test(sample_name, conn)
+
+
 def insert_hardcoded_oscar(sample_name):
     """
     Hardcoded example of OSCAR 
@@ -511,40 +996,84 @@ def insert_hardcoded_oscar(sample_name):
 
 
 
-# Example usage for connecting locally, tokens have no security issue 
-if __name__ == "__main__":
-    conn = psycopg2.connect(
+def connect_oscar_db():
+    """
+    Opens a connection to the OSCAR-DREAM OMOP database.
+    """
+    return psycopg2.connect(
         dbname="oscar_dream_db",
         user="oscar_dream",
         password="oscar_dream",
         host="10.62.55.108",
         port="5432"
     )
-     
-    input_file = "/mnt/oscar_dream_dgm/data/oscar-dream-565.txt"
 
 
-    care_site_id, care_site_name, place_of_service, location_id = extract_care_site()
-    insert_care_site(care_site_id, care_site_name, place_of_service, location_id, conn)
+def read_sample_names(input_file: str):
+    """
+    Reads the cohort file, one sample name per line.
+    """
+    with open(input_file, "r") as file:
+        return [line.strip() for line in file if line.strip()]
 
-# Open the file and process each line
-with open(input_file, "r") as file:
-    for line in file:
-        line = line.strip()  # Remove leading/trailing spaces and newlines
-        sample_name=line
-        print(f"Processing: {sample_name}")  # Do something with the line (e.g., print)
 
-        #insert_hardcoded_oscar(sample_name)
-        person_id, gender, birth_year, race, care_site_id = parse_person(sample_name)
-        insert_person(person_id, gender, birth_year, race, care_site_id, conn)
+# Example usage for connecting locally, tokens have no security issue 
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Load a cohort sample list into the OSCAR OMOP database")
+    parser.add_argument("--input", default="/mnt/oscar_dream_dgm/data/oscar-dream-565.txt", help="Cohort file, one sample name per line")
+    parser.add_argument("--export-dir", help="Write a COPY-ready TSV bundle to this directory instead of inserting rows")
+    parser.add_argument("--load-dir", help="Load a bundle written with --export-dir using one COPY per table")
+    parser.add_argument("--migrate-annotation-schema", action="store_true",
+                        help="Create the VARIANT_ANNOTATION_PAYLOAD table and decoded view, then exit")
+    parser.add_argument("--vocabulary", help="Vocabulary index from omop_vocabulary.py build; hard-coded concept IDs are used without it")
+    parser.add_argument("--workers", type=int, help="Transform processes used by --export-dir (defaults to the CPU count)")
+    parser.add_argument("--metrics", help="Write run metrics to this file (*.prom for a Prometheus textfile, JSON otherwise)")
+    parser.add_argument("--log-level", default="INFO", help="Logging level; per-row messages are logged at DEBUG")
+    args = parser.parse_args()
 
-        person_id, procedure_concept_id, procedure_date, procedure_type_concept_id= parse_procedure_occurence(sample_name)
-        procedure_occurrence_id = insert_procedure_occurrence( person_id, procedure_concept_id, procedure_date, procedure_type_concept_id,conn)
-              
-        specimen_concept_id,specimen_date, anatomic_site, disease_status= parse_specimen(sample_name)
-        insert_specimen(person_id, procedure_occurrence_id, specimen_concept_id, specimen_date, anatomic_site, disease_status, conn)
+    logging.basicConfig(level=args.log_level.upper(), format="%(asctime)s %(levelname)s %(message)s")
 
-    
- 
+    if args.migrate_annotation_schema:
+        conn = connect_oscar_db()
+        migrated = create_annotation_payload_schema(conn)
+        conn.close()
+        sys.exit(0 if migrated else 1)
+
+    elif args.export_dir:
+        written = export_bundle(read_sample_names(args.input), args.export_dir, args.workers, args.vocabulary)
+        for table, count in written.items():
+            logger.info("Exported %d rows to %s", count, os.path.join(args.export_dir, f"{table}.tsv"))
+
+    elif args.load_dir:
+        conn = connect_oscar_db()
+        load_bundle(args.load_dir, conn)
+        conn.close()
+
+    else:
+        conn = connect_oscar_db()
+
+        input_file = args.input
+        load_concepts(args.vocabulary)
+
+
+        care_site_id, care_site_name, place_of_service, location_id = extract_care_site()
+        insert_care_site(care_site_id, care_site_name, place_of_service, location_id, conn)
+
+        seen_persons = set()
+
+        # Open the file and process each line
+        with open(input_file, "r") as file:
+            for line in file:
+                line = line.strip()  # Remove leading/trailing spaces and newlines
+                sample_name=line
+
+                #insert_hardcoded_oscar(sample_name)
+                load_sample(sample_name, conn, seen_persons)
+
+        logger.info("Registered %d distinct genomic test configuration(s)", len(GENOMIC_TEST_REGISTRY))
+
+        conn.close()
 
-    conn.close()
+    if args.metrics:
+        write_metrics(args.metrics)
+        logger.info("Run metrics written to %s", args.metrics)
@@ -0,0 +1,263 @@
+"""
+===========================================================
+OSCAR-DREAM Load Reconciliation
+===========================================================
+
+Description:
+-------------
+Checks that a cohort batch loaded by bin/parse.py landed in the OMOP
+database as expected, without row-by-row queries.
+
+For each table (PERSON, PROCEDURE_OCCURRENCE, SPECIMEN) the expected rows
+are rebuilt on the client from the sample names and reduced to a count
+and an order-independent checksum (sum of per-row md5 prefixes), keyed by
+person_id (extract_prefix). PERSON holds one row per distinct person_id,
+taken from the person's first sample, as both load paths of bin/parse.py
+write it. PROCEDURE_OCCURRENCE and SPECIMEN rows belong to a sample, so
+the server side only counts the (person_id, date) pairs of the batch and
+persons sequenced in an earlier batch do not show up as mismatches. The server computes the same aggregate in one
+query per table. Only when they differ is the key set bisected, so the
+mismatching person_ids are found in O(log n) extra queries.
+
+Usage:
+------
+$ python reconcile.py --input /mnt/oscar_dream_dgm/data/oscar-dream-565.txt
+===========================================================
+"""
+
+import argparse
+import hashlib
+import logging
+import os
+import sys
+from collections import defaultdict
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+import parse
+from oscar_metrics import timed, increment, write_metrics
+
+logger = logging.getLogger(__name__)
+
+
+# Compared columns per table, key column first. Database-assigned IDs are left out.
+RECONCILE_TABLES = {
+    "PERSON": ("person_id", "gender", "birth_year", "race", "care_site_id"),
+    "PROCEDURE_OCCURRENCE": ("person_id", "procedure_concept_id", "procedure_date", "procedure_type_concept_id"),
+    "SPECIMEN": ("person_id", "specimen_concept_id", "specimen_date", "anatomic_site", "disease_status"),
+}
+
+# Per-sample tables: column restricting the server side to the batch, with the person_id
+BATCH_COLUMNS = {
+    "PROCEDURE_OCCURRENCE": "procedure_date",
+    "SPECIMEN": "specimen_date",
+}
+
+# Key sets this small are compared key by key instead of bisected further
+LEAF_SIZE = 16
+
+NULL_TEXT = "\\N"
+
+
+def row_checksum(values) -> int:
+    """
+    Signed 64-bit checksum of a row, identical to the SQL in checksum_sql.
+    """
+    text = "|".join(NULL_TEXT if value is None else str(value) for value in values)
+    checksum = int(hashlib.md5(text.encode()).hexdigest()[:16], 16)
+    return checksum - (1 << 64) if checksum >= (1 << 63) else checksum
+
+
+def checksum_sql(columns) -> str:
+    """
+    SQL expression computing row_checksum server side.
+    """
+    fields = ", ".join(f"coalesce({column}::text, '{NULL_TEXT}')" for column in columns)
+    return f"('x' || substr(md5(concat_ws('|', {fields})), 1, 16))::bit(64)::bigint"
+
+
+def expected_rows(sample_name: str):
+    """
+    Rows bin/parse.py writes for a sample, in RECONCILE_TABLES column order.
+    """
+    person_id, gender, birth_year, race, care_site_id = parse.parse_person(sample_name)
+    _, procedure_concept_id, procedure_date, procedure_type_concept_id = parse.parse_procedure_occurence(sample_name)
+    specimen_concept_id, specimen_date, anatomic_site, disease_status = parse.parse_specimen(sample_name)
+    return {
+        "PERSON": (person_id, gender, birth_year, race, care_site_id),
+        "PROCEDURE_OCCURRENCE": (person_id, procedure_concept_id, procedure_date, procedure_type_concept_id),
+        "SPECIMEN": (person_id, specimen_concept_id, specimen_date, anatomic_site, disease_status),
+    }
+
+
+def client_aggregates(sample_names):
+    """
+    Per table and person_id, the expected (row count, checksum sum).
+
+    PERSON is counted once per person_id; the other tables once per sample.
+
+    Returns:
+        tuple: (table -> {person_id: [count, checksum]},
+                table -> {person_id: set of BATCH_COLUMNS values} for the per-sample tables)
+    """
+    aggregates = {table: defaultdict(lambda: [0, 0]) for table in RECONCILE_TABLES}
+    batch_values = {table: defaultdict(set) for table in BATCH_COLUMNS}
+    with timed("reconcile_client"):
+        for sample_name in sample_names:
+            rows = expected_rows(sample_name)
+            if rows["PERSON"][0] is None:
+                logger.warning("Skipping %s: no person_id prefix", sample_name)
+                continue
+            for table, row in rows.items():
+                if table == "PERSON" and row[0] in aggregates[table]:
+                    continue
+                entry = aggregates[table][row[0]]
+                entry[0] += 1
+                entry[1] += row_checksum(row)
+                if table in BATCH_COLUMNS:
+                    batch_values[table][row[0]].add(row[RECONCILE_TABLES[table].index(BATCH_COLUMNS[table])])
+    return aggregates, batch_values
+
+
+def batch_filter(table, keys, batch_values):
+    """
+    WHERE clause selecting the rows of `table` loaded by this batch for the person_ids in `keys`.
+
+    Returns:
+        tuple: (SQL condition, query parameters)
+    """
+    key_column = RECONCILE_TABLES[table][0]
+    batch_column = BATCH_COLUMNS.get(table)
+    if batch_column is None:
+        return f"{key_column}::text = ANY(%s)", (list(keys),)
+    pairs = [(key, value) for key in keys for value in batch_values[table][key]]
+    condition = f"({key_column}::text, {batch_column}) IN (SELECT * FROM unnest(%s::text[], %s::date[]))"
+    return condition, ([key for key, _ in pairs], [value for _, value in pairs])
+
+
+def server_aggregate(cur, table, keys, batch_values):
+    """
+    One aggregate query over the batch's rows of `table` whose key is in `keys`.
+
+    Returns:
+        tuple: (row count, checksum sum)
+    """
+    columns = RECONCILE_TABLES[table]
+    condition, params = batch_filter(table, keys, batch_values)
+    query = f"SELECT count(*), coalesce(sum({checksum_sql(columns)}), 0) FROM {table} WHERE {condition}"
+    with timed("reconcile_query"):
+        cur.execute(query, params)
+        count, checksum = cur.fetchone()
+    increment("reconcile_queries")
+    return count, int(checksum)
+
+
+def server_aggregates_by_key(cur, table, keys, batch_values):
+    """
+    Per-key aggregates over the batch's rows for a small key set.
+
+    Returns:
+        dict: person_id -> (row count, checksum sum)
+    """
+    columns = RECONCILE_TABLES[table]
+    condition, params = batch_filter(table, keys, batch_values)
+    query = (f"SELECT {columns[0]}::text, count(*), sum({checksum_sql(columns)}) FROM {table} "
+             f"WHERE {condition} GROUP BY 1")
+    with timed("reconcile_query"):
+        cur.execute(query, params)
+        rows = cur.fetchall()
+    increment("reconcile_queries")
+    return {key: (count, int(checksum)) for key, count, checksum in rows}
+
+
+def find_mismatches(cur, table, keys, expected, batch_values):
+    """
+    Bisects `keys` until the person_ids whose rows differ are isolated.
+
+    Parameters:
+        cur: Open database cursor.
+        table (str): Table to check.
+        keys (list): Sorted person_ids to check.
+        expected (dict): person_id -> [count, checksum] from client_aggregates.
+        batch_values (dict): Batch column values per table and person_id from client_aggregates.
+
+    Returns:
+        list: (person_id, expected (count, checksum), found (count, checksum)).
+    """
+    expected_total = (sum(expected[key][0] for key in keys), sum(expected[key][1] for key in keys))
+    if server_aggregate(cur, table, keys, batch_values) == expected_total:
+        return []
+
+    if len(keys) <= LEAF_SIZE:
+        found = server_aggregates_by_key(cur, table, keys, batch_values)
+        mismatches = []
+        for key in keys:
+            wanted = tuple(expected[key])
+            got = found.get(key, (0, 0))
+            if got != wanted:
+                mismatches.append((key, wanted, got))
+        return mismatches
+
+    middle = len(keys) // 2
+    return (find_mismatches(cur, table, keys[:middle], expected, batch_values)
+            + find_mismatches(cur, table, keys[middle:], expected, batch_values))
+
+
+def reconcile(sample_names, conn, tables=None):
+    """
+    Reconciles a loaded batch against the database.
+
+    Parameters:
+        sample_names (list): Sample names of the batch.
+        conn: Active PostgreSQL database connection.
+        tables (list): Tables to check, defaults to every table in RECONCILE_TABLES.
+
+    Returns:
+        dict: table -> list of mismatches as returned by find_mismatches.
+    """
+    aggregates, batch_values = client_aggregates(sample_names)
+    results = {}
+    with conn.cursor() as cur:
+        for table in tables or RECONCILE_TABLES:
+            expected = aggregates[table]
+            results[table] = find_mismatches(cur, table, sorted(expected), expected, batch_values)
+    conn.rollback()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Reconcile a loaded cohort batch against the OSCAR OMOP database")
+    parser.add_argument("--input", required=True, help="Cohort file of the batch, one sample name per line")
+    parser.add_argument("--vocabulary", help="Vocabulary index the batch was loaded with (parse.py --vocabulary)")
+    parser.add_argument("--tables", nargs="+", choices=list(RECONCILE_TABLES), help="Tables to check (default: all)")
+    parser.add_argument("--metrics", help="Write run metrics to this file (*.prom for a Prometheus textfile, JSON otherwise)")
+    parser.add_argument("--log-level", default="INFO", help="Logging level")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=args.log_level.upper(), format="%(asctime)s %(levelname)s %(message)s")
+    parse.load_concepts(args.vocabulary)
+
+    conn = parse.connect_oscar_db()
+    try:
+        results = reconcile(parse.read_sample_names(args.input), conn, args.tables)
+    finally:
+        conn.close()
+
+    mismatched = False
+    for table, mismatches in results.items():
+        if not mismatches:
+            logger.info("%s: OK", table)
+            continue
+        mismatched = True
+        logger.error("%s: %d person_id(s) differ", table, len(mismatches))
+        for key, wanted, got in mismatches:
+            logger.error("  %s: expected %d row(s), found %d%s", key, wanted[0], got[0],
+                         " (content differs)" if wanted[0] == got[0] else "")
+
+    if args.metrics:
+        write_metrics(args.metrics)
+
+    sys.exit(1 if mismatched else 0)
+
+
+if __name__ == "__main__":
+    main()
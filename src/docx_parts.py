@@ -0,0 +1,237 @@
+"""
+===========================================================
+OSCAR-DREAM Selective DOCX Part Loader
+===========================================================
+
+Description:
+-------------
+Lightweight alternative to python-docx's Document() for text extraction.
+Document() loads and decompresses every part of the package, including
+logos, images and embedded objects of the report templates. Text
+extraction only needs the main document part plus the header and footer
+parts it references, so this loader reads the zip central directory and
+inflates only those XML parts. Media and unrelated relationships are
+never decompressed.
+
+The extracted text follows python-docx semantics (paragraph.text,
+row.cells with merged cells repeated, section headers/footers), so the
+output of dump_docx is unchanged.
+
+Only leaf operations are timed (file_open, xml_parse and the *_extraction
+stages never contain one another), so the stage totals add up to at most
+the wall time of a parse.
+===========================================================
+"""
+
+import posixpath
+import zipfile
+import xml.etree.ElementTree as ET
+
+from oscar_metrics import timed
+
+
+W_NS = "http://schemas.openxmlformats.org/wordprocessingml/2006/main"
+R_NS = "http://schemas.openxmlformats.org/officeDocument/2006/relationships"
+PKG_REL_NS = "http://schemas.openxmlformats.org/package/2006/relationships"
+OFFICE_DOCUMENT_REL = "http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument"
+
+
+def w(tag):
+    """Qualified WordprocessingML tag name."""
+    return f"{{{W_NS}}}{tag}"
+
+
+# Run children contributing text, as rendered by python-docx's Run.text
+# (None: depends on the element, see run_item_text)
+RUN_TEXT = {
+    w("t"): None,
+    w("tab"): "\t",
+    w("ptab"): "\t",
+    w("br"): None,
+    w("cr"): "\n",
+    w("noBreakHyphen"): "-",
+}
+
+
+class DocxPackage:
+    """
+    Read-only view over a DOCX package that inflates parts on demand.
+    """
+
+    def __init__(self, file_path):
+        # Only the central directory is read here
+        with timed("file_open"):
+            self.zip = zipfile.ZipFile(file_path)
+        self.document_part = self._main_document_part()
+
+    def read_xml(self, part_name):
+        """Decompresses and parses one XML part."""
+        with timed("xml_parse"):
+            return ET.fromstring(self.zip.read(part_name))
+
+    def relationships(self, part_name):
+        """
+        Relationship ID -> target part name, for the relationships of a part.
+        """
+        rels_name = posixpath.join(posixpath.dirname(part_name), "_rels", posixpath.basename(part_name) + ".rels")
+        try:
+            root = self.read_xml(rels_name)
+        except KeyError:
+            return {}
+        base = posixpath.dirname(part_name)
+        targets = {}
+        for rel in root.iter(f"{{{PKG_REL_NS}}}Relationship"):
+            if rel.get("TargetMode") == "External":
+                continue
+            target = rel.get("Target")
+            targets[rel.get("Id")] = target.lstrip("/") if target.startswith("/") else posixpath.normpath(posixpath.join(base, target))
+        return targets
+
+    def _main_document_part(self):
+        root = self.read_xml("_rels/.rels")
+        for rel in root.iter(f"{{{PKG_REL_NS}}}Relationship"):
+            if rel.get("Type") == OFFICE_DOCUMENT_REL:
+                return rel.get("Target").lstrip("/")
+        return "word/document.xml"
+
+    def close(self):
+        self.zip.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def run_item_text(item):
+    """Text of one run child, matching python-docx's str() of the element."""
+    text = RUN_TEXT[item.tag]
+    if text is not None:
+        return text
+    if item.tag == w("br"):
+        # Only line breaks are text; page and column breaks render as ""
+        return "\n" if item.get(w("type"), "textWrapping") == "textWrapping" else ""
+    return item.text or ""
+
+
+def paragraph_text(p):
+    """Text of a w:p element, matching python-docx's Paragraph.text."""
+    text = []
+    for child in p:
+        if child.tag == w("r"):
+            runs = (child,)
+        elif child.tag == w("hyperlink"):
+            runs = child.iterfind(w("r"))
+        else:
+            continue
+        for run in runs:
+            for item in run:
+                if item.tag in RUN_TEXT:
+                    text.append(run_item_text(item))
+    return "".join(text)
+
+
+def cell_text(tc):
+    """Text of a w:tc element, matching python-docx's _Cell.text."""
+    return "\n".join(paragraph_text(p) for p in tc.iterfind(w("p")))
+
+
+def table_rows(tbl):
+    """
+    Rows of a w:tbl element as lists of cell texts, matching python-docx's
+    row.cells: horizontally merged cells are repeated once per grid column
+    and vertically merged continuation cells take the text of the merge origin.
+    """
+    rows = []
+    above = {}
+    for tr in tbl.iterfind(w("tr")):
+        cells = []
+        for tc in tr.iterfind(w("tc")):
+            tc_pr = tc.find(w("tcPr"))
+            span = 1
+            v_merge = None
+            if tc_pr is not None:
+                grid_span = tc_pr.find(w("gridSpan"))
+                if grid_span is not None:
+                    span = int(grid_span.get(w("val"), 1))
+                v_merge = tc_pr.find(w("vMerge"))
+
+            grid_col = len(cells)
+            if v_merge is not None and v_merge.get(w("val"), "continue") == "continue" and grid_col in above:
+                text = above[grid_col]
+            else:
+                text = cell_text(tc)
+
+            for offset in range(span):
+                above[grid_col + offset] = text
+                cells.append(text)
+        rows.append(cells)
+    return rows
+
+
+def section_properties(body):
+    """w:sectPr elements of the body in document order, one per section."""
+    sections = [p_pr.find(w("sectPr")) for p_pr in body.iterfind(f"{w('p')}/{w('pPr')}")]
+    sections = [sect_pr for sect_pr in sections if sect_pr is not None]
+    final = body.find(w("sectPr"))
+    if final is not None:
+        sections.append(final)
+    return sections
+
+
+def load_docx_content(file_path, tables=True, headers_footers=True):
+    """
+    Reads the text content of a DOCX file, inflating only the XML parts
+    needed: the main document and, if asked for, the header/footer parts
+    it references.
+
+    Parameters:
+        file_path (str): Path to DOCX file.
+        tables (bool): Extract tables.
+        headers_footers (bool): Extract headers and footers.
+
+    Returns:
+        dict: Same structure as oscar_etl.read_docx_content.
+    """
+    with DocxPackage(file_path) as package:
+        document = package.read_xml(package.document_part)
+        body = document.find(w("body"))
+
+        content = {"paragraphs": [], "tables": [], "headers_footers": []}
+
+        with timed("paragraph_extraction"):
+            content["paragraphs"] = [paragraph_text(p) for p in body.iterfind(w("p"))]
+
+        if tables:
+            with timed("table_extraction"):
+                content["tables"] = [table_rows(tbl) for tbl in body.iterfind(w("tbl"))]
+
+        if not headers_footers:
+            return content
+
+        relationships = None
+        parts = {}
+        linked = {"header": None, "footer": None}
+        for section_idx, sect_pr in enumerate(section_properties(body), start=1):
+            for kind in ("header", "footer"):
+                reference = next((ref for ref in sect_pr.iterfind(w(f"{kind}Reference"))
+                                  if ref.get(w("type")) == "default"), None)
+                if reference is not None:
+                    if relationships is None:
+                        relationships = package.relationships(package.document_part)
+                    part_name = relationships.get(reference.get(f"{{{R_NS}}}id"))
+                    if part_name not in parts:
+                        # Parsed under xml_parse, outside the extraction timer
+                        root = package.read_xml(part_name)
+                        with timed("header_footer_extraction"):
+                            parts[part_name] = [paragraph_text(p) for p in root.iterfind(w("p"))]
+                    linked[kind] = parts[part_name]
+
+                # Without a definition of its own a section shows the previous section's;
+                # python-docx adds an empty one-paragraph definition when there is none.
+                paragraphs = linked[kind] if linked[kind] is not None else [""]
+                if paragraphs:
+                    content["headers_footers"].append((section_idx, kind.capitalize(), paragraphs))
+
+    return content
@@ -54,11 +54,16 @@ Notes:
 
 import argparse
 import pandas as pd
-from docx import Document
 import hashlib
 import re
 import sys
 import os
+import logging
+
+from oscar_metrics import timed, increment, write_metrics
+from docx_parts import load_docx_content
+
+logger = logging.getLogger(__name__)
 
 
 # ----------------------------
@@ -88,7 +93,34 @@ def extract_report_version(filename):
     
 
 
-def dump_docx(file_path):
+def read_docx_content(file_path):
+    """
+    Reads the readable text content of a DOCX file, keeping its structure:
+    - Paragraphs
+    - Tables, as rows of cell texts
+    - Header/footer text per section (if available)
+
+    Parameters:
+        file_path (str): Path to DOCX file.
+
+    Returns:
+        dict: {"paragraphs": [str], "tables": [[[str]]],
+               "headers_footers": [(section_idx, "Header" | "Footer", [str])]},
+              or None if the file cannot be opened.
+    """
+    try:
+        # Only document.xml and the header/footer parts are inflated, never the media
+        content = load_docx_content(file_path)
+    except Exception as e:
+        increment("file_open_errors")
+        logger.error("Error opening file %s: %s", file_path, e)
+        return None
+
+    content["tables"] = [[[cell.strip() for cell in row] for row in rows] for rows in content["tables"]]
+    return content
+
+
+def dump_docx(file_path, index=None):
     """
     Dump all readable text content from a DOCX file, including:
     - Paragraphs
@@ -97,45 +129,36 @@ def dump_docx(file_path):
 
     Parameters:
         file_path (str): Path to DOCX file.
+        index (ReportIndex): Optional search index the content is added to.
 
     Returns:
         str: Combined plain text from the document.
     """
-    try:
-        doc = Document(file_path)
-    except Exception as e:
-        print(f"Error opening file {file_path}: {e}")
+    content = read_docx_content(file_path)
+    if content is None:
         return None
 
+    if index is not None:
+        with timed("report_indexing"):
+            index.add_report(file_path, extract_report_version(file_path), content)
+
     full_text = []
 
-    # --- Extract paragraphs ---
     full_text.append("=== PARAGRAPHS ===")
-    for para in doc.paragraphs:
-        full_text.append(para.text)
+    full_text.extend(content["paragraphs"])
 
-    # --- Extract tables ---
     full_text.append("\n=== TABLES ===")
-    for table_idx, table in enumerate(doc.tables, start=1):
+    for table_idx, rows in enumerate(content["tables"], start=1):
         full_text.append(f"\n--- Table {table_idx} ---")
-        for row_idx, row in enumerate(table.rows, start=1):
-            cells = [cell.text.strip() for cell in row.cells]
+        for row_idx, cells in enumerate(rows, start=1):
             full_text.append(f"Row {row_idx}: " + " | ".join(cells))
 
-    # --- Extract headers & footers (if any) ---
     full_text.append("\n=== HEADERS & FOOTERS ===")
-    for section_idx, section in enumerate(doc.sections, start=1):
-        header = section.header
-        footer = section.footer
-        if header and header.paragraphs:
-            full_text.append(f"\n--- Section {section_idx} Header ---")
-            for para in header.paragraphs:
-                full_text.append(para.text)
-        if footer and footer.paragraphs:
-            full_text.append(f"\n--- Section {section_idx} Footer ---")
-            for para in footer.paragraphs:
-                full_text.append(para.text)
+    for section_idx, kind, paragraphs in content["headers_footers"]:
+        full_text.append(f"\n--- Section {section_idx} {kind} ---")
+        full_text.extend(paragraphs)
 
+    increment("reports_parsed")
     return "\n".join(full_text)
 
 
@@ -150,13 +173,14 @@ def read_docx(file_path):
         str: Full text of the document.
     """
     try:
-        doc = Document(file_path)
+        content = load_docx_content(file_path, tables=False, headers_footers=False)
     except Exception as e:
-        print(f"Error opening file {file_path}: {e}")
+        increment("file_open_errors")
+        logger.error("Error opening file %s: %s", file_path, e)
         return None
 
     # Extract paragraphs that are not empty
-    full_text = [para.text for para in doc.paragraphs if para.text.strip() != ""]
+    full_text = [text for text in content["paragraphs"] if text.strip() != ""]
     
     return "\n".join(full_text)
 
@@ -184,63 +208,68 @@ def parse_variants(text):
 # Version-specific Parsers
 # ----------------------------
 
-def parse_v1(file_path):
-    print("Parsing using V1 logic")
+def parse_v1(file_path, index=None):
+    logger.debug("Parsing using V1 logic")
     # TODO: implement version-specific parsing
-    return dump_docx(file_path)
+    return dump_docx(file_path, index)
 
-def parse_v2(file_path):
-    print("Parsing using V2 logic")
-    return dump_docx(file_path)
+def parse_v2(file_path, index=None):
+    logger.debug("Parsing using V2 logic")
+    return dump_docx(file_path, index)
 
-def parse_v3(file_path):
-    print("Parsing using V3 logic")
-    return dump_docx(file_path)
+def parse_v3(file_path, index=None):
+    logger.debug("Parsing using V3 logic")
+    return dump_docx(file_path, index)
 
-def parse_v4(file_path):
-    print("Parsing using V4 logic")
-    return dump_docx(file_path)
+def parse_v4(file_path, index=None):
+    logger.debug("Parsing using V4 logic")
+    return dump_docx(file_path, index)
 
-def parse_v5(file_path):
-    print("Parsing using V5 logic")
-    return dump_docx(file_path)
+def parse_v5(file_path, index=None):
+    logger.debug("Parsing using V5 logic")
+    return dump_docx(file_path, index)
 
-def parse_v6(file_path):
-    print("Parsing using V6 logic")
-    return dump_docx(file_path)
+def parse_v6(file_path, index=None):
+    logger.debug("Parsing using V6 logic")
+    return dump_docx(file_path, index)
 
-def parse_vn_plus_1(file_path):
-    print("Using fallback parser for unknown or new version")
-    return dump_docx(file_path)
+def parse_vn_plus_1(file_path, index=None):
+    logger.debug("Using fallback parser for unknown or new version")
+    return dump_docx(file_path, index)
 
 
 # ----------------------------
 # Version Dispatcher (Auxiliary Function)
 # ----------------------------
 
-def dispatch_parser_by_version(file_path):
+def dispatch_parser_by_version(file_path, index=None):
     """
     Auxiliary function that selects which parser to use
     based on the detected report version.
+
+    When a ReportIndex is given, the report content is added to it
+    while the report is parsed.
     """
-    version = extract_report_version(file_path)
-    print(f"=== DOCUMENT VERSION === {version}")
+    with timed("regex_extraction"):
+        version = extract_report_version(file_path)
+    logger.debug("=== DOCUMENT VERSION === %s", version)
+    increment(f"report_versions.{version}")
 
     match version:
         case "V1":
-            return parse_v1(file_path)
+            return parse_v1(file_path, index)
         case "V2":
-            return parse_v2(file_path)
+            return parse_v2(file_path, index)
         case "V3":
-            return parse_v3(file_path)
+            return parse_v3(file_path, index)
         case "V4":
-            return parse_v4(file_path)
+            return parse_v4(file_path, index)
         case "V5":
-            return parse_v5(file_path)
+            return parse_v5(file_path, index)
         case "V6":
-            return parse_v6(file_path)
+            return parse_v6(file_path, index)
         case _:
-            return parse_vn_plus_1(file_path)
+            return parse_vn_plus_1(file_path, index)
 
 
 
@@ -254,6 +283,13 @@ def main():
     parser.add_argument("--output", required=True, help="Path to output CSV file")
     args = parser.parse_args()"""
 
+    cli = argparse.ArgumentParser(description="Dump a genomic DOCX report")
+    cli.add_argument("--metrics", help="Write run metrics to this file (*.prom for a Prometheus textfile, JSON otherwise)")
+    cli.add_argument("--log-level", default="INFO", help="Logging level; per-report messages are logged at DEBUG")
+    cli_args = cli.parse_args()
+
+    logging.basicConfig(level=cli_args.log_level.upper(), format="%(asctime)s %(levelname)s %(message)s")
+
     # working examples for V1-> V6 
    
     file_path="dev" 
@@ -266,6 +302,9 @@ def main():
     else:
         print("Failed to read the document.")
 
+    if cli_args.metrics:
+        write_metrics(cli_args.metrics)
+
     #text = read_docx(file_path)
     
 """
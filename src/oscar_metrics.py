@@ -0,0 +1,164 @@
+"""
+===========================================================
+OSCAR-DREAM Run Metrics
+===========================================================
+
+Description:
+-------------
+Low-overhead counters and latency histograms for the parsing and loading
+stages (file open, XML parse, table extraction, regex extraction,
+database execute, commit). Metrics are kept in process memory for the
+whole run and written once at the end, either as a JSON summary or as a
+Prometheus textfile (for the node_exporter textfile collector).
+
+Usage:
+------
+    from oscar_metrics import timed, increment, write_metrics
+
+    with timed("db_execute"):
+        cur.execute(query, params)
+    increment("rows_inserted.PERSON")
+
+    write_metrics("run_metrics.json")   # or "run_metrics.prom"
+===========================================================
+"""
+
+import bisect
+import json
+import os
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+
+
+# Upper bounds (seconds) of the latency histogram buckets
+BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+COUNTERS = defaultdict(int)
+HISTOGRAMS = {}
+
+
+class Histogram:
+    """
+    Fixed-bucket latency histogram; observing a value is one bisect and two additions.
+    """
+
+    __slots__ = ("count", "total", "maximum", "bucket_counts")
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.maximum = 0.0
+        self.bucket_counts = [0] * (len(BUCKETS) + 1)
+
+    def observe(self, seconds):
+        self.count += 1
+        self.total += seconds
+        if seconds > self.maximum:
+            self.maximum = seconds
+        self.bucket_counts[bisect.bisect_left(BUCKETS, seconds)] += 1
+
+    def quantile(self, q):
+        """Upper bound of the bucket holding the q-th quantile."""
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        for bound, bucket_count in zip(BUCKETS, self.bucket_counts):
+            seen += bucket_count
+            if seen >= rank:
+                return min(bound, self.maximum)
+        return self.maximum
+
+
+def increment(name, value=1):
+    """Adds `value` to the counter `name`."""
+    COUNTERS[name] += value
+
+
+def observe(stage, seconds):
+    """Records one latency sample for `stage`."""
+    histogram = HISTOGRAMS.get(stage)
+    if histogram is None:
+        histogram = HISTOGRAMS[stage] = Histogram()
+    histogram.observe(seconds)
+
+
+@contextmanager
+def timed(stage):
+    """Context manager recording the wall time of its body under `stage`."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(stage, time.perf_counter() - start)
+
+
+def reset():
+    """Clears every counter and histogram."""
+    COUNTERS.clear()
+    HISTOGRAMS.clear()
+
+
+def summary():
+    """
+    Returns:
+        dict: Counters and per-stage latency statistics (seconds).
+    """
+    stages = {}
+    for stage, histogram in sorted(HISTOGRAMS.items()):
+        stages[stage] = {
+            "count": histogram.count,
+            "total_seconds": histogram.total,
+            "mean_seconds": histogram.total / histogram.count if histogram.count else None,
+            "p50_seconds": histogram.quantile(0.5),
+            "p99_seconds": histogram.quantile(0.99),
+            "max_seconds": histogram.maximum,
+        }
+    return {"counters": dict(sorted(COUNTERS.items())), "stages": stages}
+
+
+def _atomic_write(path, text):
+    # Write then rename, so collectors never read a half-written file
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w") as f:
+        f.write(text)
+    os.replace(tmp_path, path)
+
+
+def write_json_summary(path):
+    """Writes summary() as JSON."""
+    _atomic_write(path, json.dumps(summary(), indent=2) + "\n")
+
+
+def write_prometheus_textfile(path, prefix="oscar"):
+    """Writes the counters and histograms in the Prometheus text exposition format."""
+    lines = [
+        f"# HELP {prefix}_events_total Events counted during the run.",
+        f"# TYPE {prefix}_events_total counter",
+    ]
+    for name, value in sorted(COUNTERS.items()):
+        lines.append(f'{prefix}_events_total{{event="{name}"}} {value}')
+
+    lines += [
+        f"# HELP {prefix}_stage_seconds Latency of each processing stage.",
+        f"# TYPE {prefix}_stage_seconds histogram",
+    ]
+    for stage, histogram in sorted(HISTOGRAMS.items()):
+        cumulative = 0
+        for bound, bucket_count in zip(BUCKETS, histogram.bucket_counts):
+            cumulative += bucket_count
+            lines.append(f'{prefix}_stage_seconds_bucket{{stage="{stage}",le="{bound}"}} {cumulative}')
+        lines.append(f'{prefix}_stage_seconds_bucket{{stage="{stage}",le="+Inf"}} {histogram.count}')
+        lines.append(f'{prefix}_stage_seconds_sum{{stage="{stage}"}} {histogram.total}')
+        lines.append(f'{prefix}_stage_seconds_count{{stage="{stage}"}} {histogram.count}')
+
+    _atomic_write(path, "\n".join(lines) + "\n")
+
+
+def write_metrics(path):
+    """Writes a Prometheus textfile for *.prom paths and a JSON summary otherwise."""
+    if path.endswith(".prom"):
+        write_prometheus_textfile(path)
+    else:
+        write_json_summary(path)
@@ -0,0 +1,219 @@
+"""
+===========================================================
+OSCAR-DREAM Report Search Index
+===========================================================
+
+Description:
+-------------
+Incremental full-text index over parsed genomic reports, stored in a
+SQLite FTS5 database. Every paragraph, table cell and header/footer line
+of a report is one indexed entry, keyed by the SHA-256 of the report file
+and its report version (extract_report_version). Reports whose hash is
+already indexed are skipped, so the parser can feed the index on every
+run and re-indexing an archive only costs the new reports.
+
+Gene, HGVS or classification lookups then run against the index without
+reopening any DOCX.
+
+Usage:
+------
+$ python report_index.py index reports.db /mnt/oscar_dream_dgm/reports/*.docx
+$ python report_index.py query reports.db BRCA1
+$ python report_index.py query reports.db "c.68_69delAG"
+===========================================================
+"""
+
+import argparse
+import hashlib
+import logging
+import sqlite3
+import sys
+from datetime import datetime, timezone
+
+logger = logging.getLogger(__name__)
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS reports (
+    report_hash TEXT PRIMARY KEY,
+    file_path TEXT NOT NULL,
+    report_version TEXT,
+    indexed_at TEXT NOT NULL
+);
+CREATE VIRTUAL TABLE IF NOT EXISTS report_text USING fts5(
+    text,
+    report_hash UNINDEXED,
+    part UNINDEXED
+);
+"""
+
+# Reports added between two commits
+COMMIT_EVERY = 100
+
+
+def file_sha256(file_path):
+    """SHA-256 of a file's bytes, read in 1 MiB chunks."""
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def content_entries(content):
+    """
+    Flattens the output of oscar_etl.read_docx_content into (part, text) entries.
+
+    Empty texts are dropped, as are cells repeated by horizontal merges.
+    """
+    for para_idx, text in enumerate(content["paragraphs"], start=1):
+        if text.strip():
+            yield f"paragraph {para_idx}", text
+
+    for table_idx, rows in enumerate(content["tables"], start=1):
+        for row_idx, cells in enumerate(rows, start=1):
+            previous = None
+            for cell_idx, text in enumerate(cells, start=1):
+                if text and text != previous:
+                    yield f"table {table_idx} row {row_idx} cell {cell_idx}", text
+                previous = text
+
+    for section_idx, kind, paragraphs in content["headers_footers"]:
+        for text in paragraphs:
+            if text.strip():
+                yield f"section {section_idx} {kind.lower()}", text
+
+
+def phrase_query(text):
+    """Quotes free text as a single FTS5 phrase, so HGVS punctuation is not read as query syntax."""
+    return '"' + text.replace('"', '""') + '"'
+
+
+class ReportIndex:
+    """
+    SQLite FTS5 index of report content.
+    """
+
+    def __init__(self, db_path):
+        self.conn = sqlite3.connect(db_path)
+        self.conn.executescript(SCHEMA)
+        self._pending = 0
+
+    def has_report(self, report_hash):
+        return self.conn.execute("SELECT 1 FROM reports WHERE report_hash = ?", (report_hash,)).fetchone() is not None
+
+    def add_report(self, file_path, report_version, content, report_hash=None):
+        """
+        Indexes the content of one report unless the same file is already indexed.
+
+        Parameters:
+            file_path (str): Path to the DOCX report.
+            report_version (str): Version from extract_report_version.
+            content (dict): Output of oscar_etl.read_docx_content.
+            report_hash (str): file_sha256 of the report if already computed, hashed here otherwise.
+
+        Returns:
+            bool: True if the report was added, False if it was already indexed.
+        """
+        if report_hash is None:
+            report_hash = file_sha256(file_path)
+        if self.has_report(report_hash):
+            return False
+
+        self.conn.execute(
+            "INSERT INTO reports (report_hash, file_path, report_version, indexed_at) VALUES (?, ?, ?, ?)",
+            (report_hash, file_path, report_version, datetime.now(timezone.utc).isoformat()),
+        )
+        self.conn.executemany(
+            "INSERT INTO report_text (text, report_hash, part) VALUES (?, ?, ?)",
+            ((text, report_hash, part) for part, text in content_entries(content)),
+        )
+
+        self._pending += 1
+        if self._pending >= COMMIT_EVERY:
+            self.commit()
+        return True
+
+    def search(self, query, limit=50, raw=False):
+        """
+        Finds report entries matching a gene, variant or any other text.
+
+        Parameters:
+            query (str): Text to look up, matched as a phrase unless raw is set.
+            limit (int): Maximum number of entries returned.
+            raw (bool): Pass query through as FTS5 query syntax (AND, OR, NEAR, prefix*).
+
+        Returns:
+            list: (file_path, report_version, report_hash, part, snippet) tuples, best match first.
+        """
+        return self.conn.execute(
+            """
+            SELECT r.file_path, r.report_version, r.report_hash, t.part,
+                   snippet(report_text, 0, '[', ']', '...', 12)
+            FROM report_text t
+            JOIN reports r ON r.report_hash = t.report_hash
+            WHERE report_text MATCH ?
+            ORDER BY t.rank
+            LIMIT ?
+            """,
+            (query if raw else phrase_query(query), limit),
+        ).fetchall()
+
+    def commit(self):
+        self.conn.commit()
+        self._pending = 0
+
+    def close(self):
+        self.commit()
+        self.conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build or query the report search index")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    index = subparsers.add_parser("index", help="Parse DOCX reports and add them to the index")
+    index.add_argument("db_path", help="SQLite index file")
+    index.add_argument("reports", nargs="+", help="DOCX reports")
+
+    query = subparsers.add_parser("query", help="Look up a gene, variant or classification")
+    query.add_argument("db_path", help="SQLite index file")
+    query.add_argument("text", help="Text to look up")
+    query.add_argument("--limit", type=int, default=50, help="Maximum number of matches")
+    query.add_argument("--raw", action="store_true", help="Treat text as FTS5 query syntax")
+
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+
+    with ReportIndex(args.db_path) as report_index:
+        if args.command == "index":
+            from oscar_etl import extract_report_version, read_docx_content
+            added = 0
+            for file_path in args.reports:
+                # Hashed once; unchanged reports are not reopened at all
+                report_hash = file_sha256(file_path)
+                if report_index.has_report(report_hash):
+                    continue
+                content = read_docx_content(file_path)
+                if content is None:
+                    continue
+                added += report_index.add_report(file_path, extract_report_version(file_path), content, report_hash)
+            logger.info("Added %d of %d report(s) to %s", added, len(args.reports), args.db_path)
+        else:
+            try:
+                matches = report_index.search(args.text, args.limit, args.raw)
+            except sqlite3.OperationalError as e:
+                logger.error("Invalid query %r: %s", args.text, e)
+                sys.exit(1)
+            for file_path, report_version, report_hash, part, snippet in matches:
+                print(f"{file_path}\t{report_version}\t{report_hash[:12]}\t{part}\t{snippet}")
+
+
+if __name__ == "__main__":
+    main()